@@ -1,280 +1,322 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+import logging
 import os
-import base64
-from io import BytesIO
-from PIL import Image
 import sys
-import numpy as np
-import cv2
-import sqlite3
+import json
+import time
 import uuid
+from datetime import datetime, timezone
 
 # Add root path so backend/app.py can import from utils/
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from utils import hough_utils, piece_detection_utils, optimal_positions_utils
+from utils import game_analysis_utils, metrics_utils, storage_utils
+from utils.job_utils import JobRunner
+from utils.pipeline_utils import Pipeline, json_response, load_config
+from utils.stream_utils import TrackerSessions, decode_frame
+from utils.worker_pool_utils import JobTimeout, WorkerCrashed
 
 app = Flask(__name__)
 CORS(app)
+
+# Every OTHELLO_* setting (see the README and pipeline_utils.load_config)
+app.config.update(load_config())
+metrics_utils.configure_logging(app.config["LOG_LEVEL"])
+logger = logging.getLogger(__name__)
+
+# The pipeline (with its worker pool), the job runner and the live streams.
+# They are started by start_services() in the process that serves requests,
+# not on import: the pool's workers re-import this module, and so does
+# anything that only wants the app object
+pipeline = jobs = streams = None
+
+def start_services():
+    global pipeline, jobs, streams
+    pipeline = Pipeline(app.config)
+    jobs = JobRunner(pipeline, app.config["ASYNC_WORKERS"], app.config["ASYNC_STALE_AFTER"])
+    streams = TrackerSessions(pipeline, app.config["STREAM_IDLE_TIMEOUT"])
+
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    # Streamed responses are counted when their headers are sent
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics_utils.REQUESTS.inc(route=route, status=response.status_code)
+    metrics_utils.REQUEST_SECONDS.observe(time.perf_counter() - g.start, route=route)
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Request, stage, search and cache metrics of this process in the Prometheus text format."""
+    return Response(metrics_utils.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/predict", methods=["POST"])
 def predict():
-    print(f"Reached predict!!!")
     if 'image' not in request.files:
         return jsonify({"error": "No image uploaded"}), 400
-    
-    #Extract the image and convert to RGB
-    image = request.files['image']
-    img_pil = Image.open(image.stream).convert("RGB")
-    img_np = np.array(img_pil)
-    img_rgb = np.float32(img_np) / 255.0
-    print(f"Converted Image to desired format")
-
-    #Detect 4 corners
-    corners = hough_utils.hough(img_rgb)
-    if corners.shape != (4, 2):
-        print("⚠️ Hough failed to detect exactly 4 corners.")
-        return jsonify({"error": "corner_detection_failed"}), 400
-
-    corners_list = corners.tolist()
-    print(f"🟩 4 Corners: {corners_list}")
-
-    #Detect each piece
-    board_state = np.zeros((8, 8))
-    dict_board = {} #Map each position on 2D board_state array to actual coordinate in the original image, so that when we get recommened move on 2d array we can easily obtain actual coordinate on the original board
-    try:
-        for row in range(8):
-            for col in range(8):
-                piece = piece_detection_utils.detect_piece(img_rgb, corners, row, col)
-                board_state[row][col] = piece[0]
-                avg_x, avg_y = piece[4]
-                dict_board[(row, col)] = (avg_y, avg_x)
-    except Exception as e:
-        print("⚠️ Piece detection failed:", e)
-        return jsonify({"error": "piece_detection_failed"}), 400
-
-    # Obtain actual scores on current board so that we don't detect score when recommened moves shown (score of original board)
-    _, white_score, black_score = optimal_positions_utils.evaluate_board(board_state)
-
-    # Check for special board states
-    board_is_empty = not np.any(board_state != 0)
-    board_is_full = not np.any(board_state == 0)
-
-    # Check valid moves
-    white_moves = optimal_positions_utils.get_valid_moves(board_state, player=1)
-    black_moves = optimal_positions_utils.get_valid_moves(board_state, player=-1)
-
-    white_best = black_best = original_coordinates_white_best = original_coordinates_black_best = None
-
-    # Determine message and skip move prediction if applicable
-    if board_is_empty:
-        lead_message = "No pieces on the board yet — the game hasn’t started."
-    elif board_is_full or (not white_moves and not black_moves):
-        if white_score > black_score:
-            lead_message = "Game over. ⚪ White wins!"
-        elif black_score > white_score:
-            lead_message = "Game over. ⚫ Black wins!"
-        else:
-            lead_message = "Game over. It’s a tie!"
-    else:
-        if white_moves:
-            _, white_best, _, _ = optimal_positions_utils.minimax(
-                board_state, 3, float('-inf'), float('inf'), True, 1
-            )
-            original_coordinates_white_best = dict_board[white_best]
-            print(f"⚪ White optimal move: {white_best}, coordinates on original image: {original_coordinates_white_best}")
-        else:
-            print("⚪ White has no valid moves.")
-
-        if black_moves:
-            _, black_best, _, _ = optimal_positions_utils.minimax(
-                board_state, 3, float('-inf'), float('inf'), True, -1
-            )
-            original_coordinates_black_best = dict_board[black_best]
-            print(f"⚫ Black optimal move: {black_best}, coordinates on original image: {original_coordinates_black_best}")
-        else:
-            print("⚫ Black has no valid moves.")
-
-        # Ongoing game status
-        if white_score > black_score:
-            lead_message = "White is currently in the lead."
-        elif black_score > white_score:
-            lead_message = "Black is currently in the lead."
-        else:
-            lead_message = "The game is currently tied."
-
-    # Draw annotated image with best moves (if applicable)
-    img_annotated = draw_optimal_moves(
-        img_rgb,
-        original_coordinates_white_best if white_best else None,
-        original_coordinates_black_best if black_best else None
-    )
 
-    # Encode image to base64
-    buffered = BytesIO()
-    Image.fromarray(img_annotated).save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    image = request.files['image']
+    output = pipeline.output_options(request.form.get("format"), request.form.get("quality"),
+                                     request.form.get("annotate"))
+    response, status = pipeline.predict(image.read(), image.filename, request.form.get("time_budget"),
+                                        output=output, profile=request.form.get("profile") == "1")
+    if status == 200 and request.form.get("transport") == "multipart" and response["image"] is not None:
+        return multipart_response(response)
+    return jsonify(json_response(response)), status
+
+def multipart_response(response):
+    """
+    multipart/mixed body with the result fields as a JSON part followed by
+    the annotated image as a binary part, which saves base64's third.
+    """
+    boundary = uuid.uuid4().hex
+    fields = {key: value for key, value in response.items() if key != "image"}
+    body = b"".join([
+        f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode(),
+        json.dumps(fields).encode(),
+        f"\r\n--{boundary}\r\nContent-Type: {response['image_type']}\r\n"
+        f"Content-Disposition: attachment; filename=\"annotated\"\r\n\r\n".encode(),
+        response["image"],
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    return Response(body, mimetype=f"multipart/mixed; boundary={boundary}")
+
+@app.route("/predict/batch", methods=["POST"])
+def predict_batch():
+    """
+    Analyses every file uploaded as `images` in parallel and streams one
+    JSON line per image (NDJSON) as each finishes, in completion order.
+    Form fields: time_budget (per image), workers, include_image (0 drops
+    the annotated image from the lines), format and quality.
+    """
+    files = request.files.getlist("images")
+    if not files:
+        return jsonify({"error": "No image uploaded"}), 400
 
-   
+    uploads = [(f.filename, f.read()) for f in files]
+    time_budget = request.form.get("time_budget")
+    include_image = request.form.get("include_image", "1") != "0"
+    try:
+        workers = int(request.form["workers"]) if "workers" in request.form else None
+    except ValueError:
+        workers = None
+    if workers is not None:
+        workers = min(workers, app.config["BATCH_WORKERS"])
+
+    # Without images there is nothing to draw
+    output = pipeline.output_options(request.form.get("format"), request.form.get("quality"), include_image)
+
+    def generate():
+        for index, filename, response, status in pipeline.predict_many(uploads, time_budget, workers=workers,
+                                                                        output=output):
+            if not include_image:
+                response.pop("image", None)
+            yield json.dumps({"index": index, "filename": filename, "status": status,
+                              **json_response(response)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """
+    Starts analysing the uploaded `image` in the background and answers at
+    once with the job id. Follow it with GET /jobs/<id> or the event stream
+    at /jobs/<id>/events.
+    """
+    if 'image' not in request.files:
+        return jsonify({"error": "No image uploaded"}), 400
 
-    # Create submission ID and base64 of original image
-    submission_id = str(uuid.uuid4())
-    original_filename = image.filename
+    image = request.files['image']
+    job_id = jobs.submit(image.read(), image.filename, request.form.get("time_budget"))
+    response = jsonify({"id": job_id, "status": "queued",
+                        "events": f"/jobs/{job_id}/events"})
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return response, 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "job_not_found"}), 404
+    return jsonify(job)
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Server-sent events with the job's progress (see JobRunner.events)."""
+    try:
+        last_version = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        last_version = 0
+    response = Response(stream_with_context(jobs.events(job_id, last_version)), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route("/streams", methods=["POST"])
+def open_stream():
+    """
+    Starts a live stream of frames of one board. Send the frames in order
+    to /streams/<id>/frames; `time_budget` is the search budget used each
+    time the board changes.
+    """
+    stream_id = streams.open(request.form.get("time_budget"))
+    response = jsonify({"id": stream_id, "frames": f"/streams/{stream_id}/frames"})
+    response.headers["Location"] = f"/streams/{stream_id}"
+    return response, 201
 
-    # Save original image to base64
-    buffered_orig = BytesIO()
-    Image.fromarray((img_rgb * 255).astype(np.uint8)).save(buffered_orig, format="PNG")
-    original_img_str = base64.b64encode(buffered_orig.getvalue()).decode("utf-8")
+@app.route("/streams/<stream_id>/frames", methods=["POST"])
+def stream_frame(stream_id):
+    """
+    Analyses the next frame of a stream, uploaded as `frame` or as the raw
+    request body, and returns the tracked board (see BoardTracker.update).
+    """
+    tracker = streams.get(stream_id)
+    if tracker is None:
+        return jsonify({"error": "stream_not_found"}), 404
+    data = request.files["frame"].read() if "frame" in request.files else request.get_data()
+    if not data:
+        return jsonify({"error": "No frame uploaded"}), 400
 
-    # Store in database
     try:
-        conn = sqlite3.connect("submissions.db")
-        cursor = conn.cursor()
-
-        # Create table with timestamp
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS submissions (
-                id TEXT PRIMARY KEY,
-                timestamp TEXT,
-                original_filename TEXT UNIQUE,  -- Prevent duplicates
-                original_image_base64 TEXT,
-                result_image_base64 TEXT,
-                white_score INTEGER,
-                black_score INTEGER,
-                lead_message TEXT
-            )
-        """)
-
-        # Check for duplicate by filename
-        cursor.execute("SELECT 1 FROM submissions WHERE original_filename = ?", (original_filename,))
-        if cursor.fetchone():
-            print(f"⚠️ Duplicate filename '{original_filename}' detected. Skipping insert.")
+        frame = decode_frame(data)
+    except OSError:
+        return jsonify({"error": "invalid_image"}), 400
+    try:
+        result = tracker.update(frame)
+    except JobTimeout:
+        return jsonify({"error": "analysis_timeout"}), 504
+    except WorkerCrashed:
+        return jsonify({"error": "internal_error"}), 500
+    return jsonify(result), 400 if "error" in result else 200
+
+@app.route("/streams/<stream_id>", methods=["DELETE"])
+def close_stream(stream_id):
+    """Closes a stream and returns how many frames, Hough runs and searches it took."""
+    stats = streams.close(stream_id)
+    if stats is None:
+        return jsonify({"error": "stream_not_found"}), 404
+    return jsonify(stats)
+
+@app.route("/games/analysis", methods=["POST"])
+def analyse_game():
+    """
+    Analyses every move of a game sent as JSON: either `moves` ("f5d6c3..."
+    or a list of moves, black first) or `boards`, a list of board states one
+    move apart. Optional `depth` and `time_budget` (per move). Returns the
+    best move, the played move's loss and a blunder flag for every ply (see
+    game_analysis_utils.analyse_game).
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or ("moves" in body) == ("boards" in body):
+        return jsonify({"error": "Send either moves or boards"}), 400
+    try:
+        if "moves" in body:
+            plies = game_analysis_utils.replay_moves(game_analysis_utils.parse_moves(body["moves"]))
         else:
-            # ✅ Use datetime('now') directly in SQL
-            cursor.execute("""
-                INSERT INTO submissions (
-                    id, timestamp, original_filename, original_image_base64,
-                    result_image_base64, white_score, black_score, lead_message
-                )
-                VALUES (?, datetime('now'), ?, ?, ?, ?, ?, ?)
-            """, (
-                submission_id,
-                original_filename,
-                original_img_str,
-                img_str,
-                int(white_score),
-                int(black_score),
-                lead_message
-            ))
-            conn.commit()
-            print(f"✅ Submission saved with ID {submission_id}")
-
-        conn.close()
-
-    except Exception as e:
-        print("⚠️ Failed to save to database:", e)
-
-
-
+            plies = game_analysis_utils.plies_from_boards(body["boards"])
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": "invalid_game", "detail": str(e)}), 400
+    try:
+        depth = int(body["depth"]) if body.get("depth") is not None else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "invalid_parameter"}), 400
 
-    return jsonify({
-        "image": img_str,
-        "white_score": int(white_score),
-        "black_score": int(black_score),
-        "lead": lead_message
-    }), 200
+    try:
+        result = game_analysis_utils.analyse_game(pipeline, plies, depth, body.get("time_budget"))
+    except JobTimeout:
+        return jsonify({"error": "analysis_timeout"}), 504
+    except WorkerCrashed:
+        return jsonify({"error": "internal_error"}), 500
+    return jsonify(result)
 
 @app.route("/history/<submission_id>", methods=["GET"])
 def get_submission(submission_id):
     try:
-        # Connect to your database
-        conn = sqlite3.connect("submissions.db")
-        cursor = conn.cursor()
-
-        # Fetch submission by ID
-        cursor.execute("SELECT original_filename, original_image_base64, result_image_base64, white_score, black_score, lead_message FROM submissions WHERE id = ?", (submission_id,))
-        row = cursor.fetchone()
-
-        conn.close()
-
-        if row:
-            return jsonify({
-                "filename": row[0],
-                "original_image": row[1],
-                "image": row[2],
-                "white_score": row[3],
-                "black_score": row[4],
-                "lead": row[5]
-            })
+        submission = storage_utils.get_submission(submission_id, app.config["DB_PATH"], app.config["BLOB_DIR"])
+        if submission:
+            return jsonify(submission)
         else:
             return jsonify({"error": "submission_not_found"}), 404
 
     except Exception as e:
-        print("❌ Failed to load previous submission:", e)
+        logger.exception("Failed to load previous submission: %s", e)
         return jsonify({"error": "internal_error"}), 500
 
+@app.route("/images/<digest>", methods=["GET"])
+def get_image(digest):
+    """Serves a stored image by its content hash; the content never changes."""
+    if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+        return jsonify({"error": "image_not_found"}), 404
+    data = storage_utils.get_blob(digest, app.config["BLOB_DIR"])
+    if data is None:
+        return jsonify({"error": "image_not_found"}), 404
+    response = Response(data, mimetype=storage_utils.sniff_image_type(data))
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({"results": pipeline.result_cache.stats(), "analysis": pipeline.analysis_cache.stats()})
+
 @app.route("/history", methods=["GET"])
 def history():
-    try:
-        conn = sqlite3.connect("submissions.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, original_filename, timestamp FROM submissions ORDER BY timestamp DESC")
-        rows = cursor.fetchall()
-        conn.close()
-
-        submissions = []
-        for row in rows:
-            submissions.append({
-                "id": row[0],
-                "filename": row[1],
-                "timestamp": row[2]
-            })
-
-        return jsonify(submissions)
-
-    except Exception as e:
-        print("❌ Failed to fetch history:", e)
-        return jsonify({"error": "internal_error"}), 500
-
-
-
-def draw_optimal_moves(image, white_coord=None, black_coord=None):
     """
-    Draws circle markers with red outlines on the image at the specified white and black
-    optimal move coordinates.
-
-    Parameters:
-    - image: np.ndarray (float32 image normalized to 0–1, RGB)
-    - white_coord: Tuple (y, x) or None
-    - black_coord: Tuple (y, x) or None
-    - marker_radius: int or None — if None, will be computed based on image size
-
-    Returns:
-    - image with circles drawn (as np.uint8 RGB image)
+    One page of submissions, newest first, streamed as
+    {"items": [...], "next_cursor": ...}. Query parameters: limit (at most
+    HISTORY_MAX_PAGE_SIZE), cursor (the previous page's next_cursor),
+    filename (prefix), since and until (ISO dates or times, UTC) and
+    thumbnails=1 to add a preview URL to each item.
     """
-    image_copy = (image.copy() * 255).astype("uint8")
-    height, width = image_copy.shape[:2]
-    cell_size = min(height, width) / 8
-    marker_radius = int(cell_size * 0.25)  # 30% of a cell; adjust 0.3 if needed
-    marker_radius = max(3, marker_radius)
-    print(f"marker_radius: {marker_radius}")
-
-    if white_coord:
-        x_w = int(round(white_coord[1]))
-        y_w = int(round(white_coord[0]))
-        cv2.circle(image_copy, (x_w, y_w), marker_radius + 4, (255, 0, 0), -1)      # Red border
-        cv2.circle(image_copy, (x_w, y_w), marker_radius, (255, 255, 255), -1)     # White fill
-
-    if black_coord:
-        x_b = int(round(black_coord[1]))
-        y_b = int(round(black_coord[0]))
-        cv2.circle(image_copy, (x_b, y_b), marker_radius + 4, (255, 0, 0), -1)      # Red border
-        cv2.circle(image_copy, (x_b, y_b), marker_radius, (0, 0, 0), -1)           # Black fill
-
-    return image_copy
-
+    try:
+        limit = int(request.args.get("limit", storage_utils.HISTORY_PAGE_SIZE))
+        limit = max(1, min(limit, storage_utils.HISTORY_MAX_PAGE_SIZE))
+        cursor = request.args.get("cursor") or None
+        if cursor is not None:
+            storage_utils.decode_cursor(cursor)
+        since, until = (history_time(request.args.get(name)) for name in ("since", "until"))
+    except ValueError:
+        return jsonify({"error": "invalid_parameter"}), 400
+    thumbnails = request.args.get("thumbnails") == "1"
+
+    # One row past the page tells whether there is a next one
+    rows = storage_utils.list_submissions(app.config["DB_PATH"], limit + 1, cursor,
+                                          request.args.get("filename"), since, until)
+
+    def generate():
+        yield '{"items": ['
+        next_cursor = last = None
+        for count, item in enumerate(rows):
+            if count == limit:
+                next_cursor = storage_utils.encode_cursor(last)
+                break
+            thumbnail_hash = item.pop("thumbnail_hash")
+            if thumbnails:
+                item["thumbnail"] = f"/images/{thumbnail_hash}" if thumbnail_hash else None
+            yield ("," if count else "") + json.dumps(item)
+            last = item
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+def history_time(value):
+    """Stored timestamp form of an ISO date or time query parameter, or None."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
 
 
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5001, debug=True)
+    start_services()
+    # Jobs left unfinished by an earlier run are picked up here, by the one
+    # process that serves requests, so no second runner competes for them
+    jobs.resume()
+    # The reloader would run this file twice, each time with its own pool
+    app.run(host="0.0.0.0", port=5001, debug=True, use_reloader=False)
@@ -12,15 +12,27 @@ function App() {
   const [progress, setProgress] = useState(0);
   const [predictionError, setPredictionError] = useState(null);
   const [previousSubmissions, setPreviousSubmissions] = useState([]);
+  const [historyCursor, setHistoryCursor] = useState(null);
   const [selectedSubmissionId, setSelectedSubmissionId] = useState(null);
   const [isGameOver, setIsGameOver] = useState(false);
   const [isBoardEmpty, setIsBoardEmpty] = useState(false);
 
-  useEffect(() => {
-    fetch("http://localhost:5001/history")
+  // Fetches the first page of history, or the page after `cursor` and appends it
+  const fetchHistory = (cursor = null) => {
+    const url = cursor
+      ? `http://localhost:5001/history?cursor=${encodeURIComponent(cursor)}`
+      : "http://localhost:5001/history";
+    fetch(url)
       .then((res) => res.json())
-      .then((data) => setPreviousSubmissions(data))
+      .then((data) => {
+        setPreviousSubmissions((prev) => (cursor ? [...prev, ...data.items] : data.items));
+        setHistoryCursor(data.next_cursor);
+      })
       .catch((err) => console.error("❌ Failed to fetch submission history:", err));
+  };
+
+  useEffect(() => {
+    fetchHistory();
   }, []);
 
   const handleImageUpload = (event) => {
@@ -65,7 +77,7 @@ function App() {
         return response.json();
       })
       .then((data) => {
-        const imageUrl = "data:image/png;base64," + data.image;
+        const imageUrl = `data:${data.image_type ?? "image/png"};base64,` + data.image;
         setResultImage(imageUrl);
         setPredictionError(false);
       
@@ -99,10 +111,7 @@ function App() {
         setProgress(100);
 
          // Refresh dropdown
-        fetch("http://localhost:5001/history")
-        .then((res) => res.json())
-        .then((data) => setPreviousSubmissions(data))
-        .catch((err) => console.error("❌ Failed to refetch submission history:", err));
+        fetchHistory();
       });
 
     const interval = setInterval(() => {
@@ -123,8 +132,8 @@ function App() {
       .then((res) => res.json())
       .then((data) => {
         setSelectedSubmissionId(submissionId);
-        setResultImage("data:image/png;base64," + data.image);
-        setUploadedImage("data:image/png;base64," + data.original_image);
+        setResultImage(`data:${data.image_type ?? "image/png"};base64,` + data.image);
+        setUploadedImage(`data:${data.original_image_type};base64,` + data.original_image);
         setWhiteScore(data.white_score ?? "—");
         setBlackScore(data.black_score ?? "—");
         setLeadMessage(data.lead ?? "");
@@ -162,6 +171,11 @@ function App() {
             </option>
           ))}
         </select>
+        {historyCursor && (
+          <button onClick={() => fetchHistory(historyCursor)} style={{ marginLeft: "0.5rem" }}>
+            Load more
+          </button>
+        )}
       </div>
 
       <div style={{ marginBottom: "1rem", marginLeft: "60px", fontSize: "1.1rem" }}>
@@ -0,0 +1,65 @@
+"""
+Analyses every move of a game like POST /games/analysis and prints a table
+of the moves, the best move in each position, the discs lost and the
+blunders, or the full result as JSON. Settings come from the same OTHELLO_*
+environment variables as the server.
+
+Usage:
+    python scripts/analyse_game.py f5d6c3d3c4... [--depth 6] [--time-budget 1.0] [--json]
+    python scripts/analyse_game.py --boards game.json    # JSON list of board states
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import game_analysis_utils, metrics_utils
+from utils.pipeline_utils import Pipeline, load_config
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("moves", nargs="*", help="moves in the usual notation, black first")
+    parser.add_argument("--boards", default=None, help="JSON file with a list of board states one move apart")
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--time-budget", type=float, default=None, help="seconds per move")
+    parser.add_argument("--json", action="store_true", help="print the full result as JSON")
+    args = parser.parse_args()
+    if bool(args.moves) == bool(args.boards):
+        parser.error("give either moves or --boards")
+
+    try:
+        if args.boards:
+            with open(args.boards) as f:
+                plies = game_analysis_utils.plies_from_boards(json.load(f))
+        else:
+            plies = game_analysis_utils.replay_moves(game_analysis_utils.parse_moves(" ".join(args.moves)))
+    except ValueError as e:
+        sys.exit(f"Invalid game: {e}")
+
+    config = load_config()
+    metrics_utils.configure_logging(config["LOG_LEVEL"])
+    pipeline = Pipeline(config)
+    try:
+        result = game_analysis_utils.analyse_game(pipeline, plies, args.depth, args.time_budget)
+    finally:
+        pipeline.close()
+
+    if args.json:
+        print(json.dumps(result))
+        return
+    print(f"{'ply':>4} {'side':<6}{'move':<6}{'best':<6}{'loss':>5}")
+    for ply in result["plies"]:
+        marker = "  blunder" if ply["blunder"] else ""
+        exact = " (exact)" if ply["exact"] else ""
+        print(f"{ply['ply']:>4} {ply['player']:<6}{ply['move']:<6}{ply['best_move']:<6}{ply['loss']:>5}{exact}{marker}")
+    for side, summary in result["summary"].items():
+        print(f"{side}: {summary['moves']} moves, {summary['blunders']} blunder(s), "
+              f"average loss {summary['average_loss']}")
+    print(f"Final score {result['white_score']}-{result['black_score']} (white-black), "
+          f"analysed at depth {result['depth']} in {result['elapsed_ms'] / 1000:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures how the parallel root-splitting search scales with the number of
+worker processes. Every position of compare_move_ordering.POSITIONS is
+searched to a fixed depth sequentially and then in parallel with 2, 4, ...
+workers; the parallel result must have the same score and best move as the
+sequential one.
+
+Usage:
+    python scripts/benchmark_parallel_search.py [--depth 6] [--workers 1 2 4 8] [--json report.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from compare_move_ordering import POSITIONS, parse_position
+from utils import bitboard_utils as bb
+from utils import optimal_positions_utils
+from utils.parallel_search_utils import parallel_negamax
+from utils.transposition_utils import TranspositionTable, zobrist_hash
+from utils.worker_pool_utils import WorkerPool
+
+TT_SIZE = 1 << 18
+
+
+def searches():
+    """Yields (name, own, opp, player) for every side with a move in every position."""
+    for name, rows in POSITIONS.items():
+        white, black = parse_position(rows)
+        for player, side in ((1, "white"), (-1, "black")):
+            own, opp = bb.split_by_player(white, black, player)
+            if bb.get_moves(own, opp):
+                yield f"{name}/{side}", own, opp, player
+
+
+def sequential(own, opp, player, depth):
+    white, black = bb.join_by_player(own, opp, player)
+    ctx = optimal_positions_utils.SearchContext(TranspositionTable(TT_SIZE))
+    start = time.perf_counter()
+    score, sq = optimal_positions_utils.negamax(
+        own, opp, player, depth, float('-inf'), float('inf'), ctx, zobrist_hash(white, black, player)
+    )
+    return score, sq, ctx.nodes, time.perf_counter() - start
+
+
+def parallel(own, opp, player, depth, pool):
+    stats = {"nodes": 0, "cutoffs": 0}
+    start = time.perf_counter()
+    score, sq = parallel_negamax(own, opp, player, depth, pool, tt_size=TT_SIZE, stats=stats)
+    return score, sq, stats["nodes"], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--workers", type=int, nargs="+", default=None,
+                        help="worker counts to try (default: powers of two up to the CPU count)")
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    worker_counts = args.workers or [n for n in (2, 4, 8, 16, 32, 64) if n <= cpus] or [2]
+    print(f"depth {args.depth}, {cpus} CPUs")
+
+    baseline = {}
+    total_time = total_nodes = 0
+    for name, own, opp, player in searches():
+        score, sq, nodes, elapsed = sequential(own, opp, player, args.depth)
+        baseline[name] = (score, sq)
+        total_time += elapsed
+        total_nodes += nodes
+    print(f"{'workers':>8}{'seconds':>10}{'speedup':>9}{'nodes':>12}{'overhead':>10}")
+    print(f"{'seq':>8}{total_time:>10.2f}{1.0:>9.2f}{total_nodes:>12}{1.0:>10.2f}")
+    report = {"depth": args.depth, "cpus": cpus,
+              "sequential": {"seconds": round(total_time, 3), "nodes": total_nodes}, "parallel": []}
+
+    mismatches = []
+    for workers in worker_counts:
+        pool = WorkerPool(workers, preload=["utils.parallel_search_utils"])
+        elapsed_total = nodes_total = 0
+        for name, own, opp, player in searches():
+            score, sq, nodes, elapsed = parallel(own, opp, player, args.depth, pool)
+            if (score, sq) != baseline[name]:
+                mismatches.append(f"{name} with {workers} workers: {(score, sq)} vs {baseline[name]}")
+            elapsed_total += elapsed
+            nodes_total += nodes
+        pool.shutdown()
+        speedup = total_time / elapsed_total
+        print(f"{workers:>8}{elapsed_total:>10.2f}{speedup:>9.2f}{nodes_total:>12}"
+              f"{nodes_total / total_nodes:>10.2f}")
+        report["parallel"].append({"workers": workers, "seconds": round(elapsed_total, 3),
+                                   "speedup": round(speedup, 2), "nodes": nodes_total})
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if mismatches:
+        sys.exit("Parallel results differ from the sequential search:\n" + "\n".join(mismatches))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Benchmarks the /predict pipeline on every photo in Test_Images/ with a
+hand-labelled board in Test_Images/Real_Board_Values/. Each photo is run
+through pipeline_utils.Pipeline.predict end to end (`predict`, with the
+caches emptied first) and stage by stage:
+
+    decode        upload bytes to the RGB arrays corner detection works on
+    mask          hough_utils.board_mask
+    hough         hough_utils.detect_lines (edges and the Hough transform)
+    clustering    hough_utils.corners_from_lines (line families and corners)
+    cells         piece_detection_utils.detect_board (the 64 cells)
+    search_white  pipeline_utils.search_position for each side
+    search_black
+
+and reports the p50/p95 latency and peak traced memory of every stage and
+the share of cells detected correctly. The report is written as JSON; with
+--baseline the run is compared to an earlier report and the script exits
+non-zero if a stage got slower or used more memory by more than
+--tolerance, or a photo got fewer cells right.
+
+Searches stop at a fixed --depth so timings compare across runs, and
+everything runs in this process (no worker pool) so memory can be traced.
+Other settings come from the same OTHELLO_* environment variables as the
+server.
+
+Usage:
+    python scripts/benchmark_pipeline.py [image_dir] [--repeat 5] [--depth 6] [--json report.json]
+                                         [--baseline previous.json] [--tolerance 0.2]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import hough_utils, optimal_positions_utils, piece_detection_utils, storage_utils
+from utils.pipeline_utils import SIDES, Pipeline, load_config, search_position
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+STAGES = ["decode", "mask", "hough", "clustering", "cells", "search_white", "search_black", "predict"]
+
+# Differences below this many milliseconds are noise, not regressions
+MIN_REGRESSION_MS = 1.0
+
+
+def photos(image_dir, real_board_dir):
+    """Yields (filename, board index) of every photo with a labelled board."""
+    for name in sorted(os.listdir(image_dir)):
+        match = re.fullmatch(r"Othello_Game_Board(\d+)\.(png|jpe?g|webp)", name, re.IGNORECASE)
+        if match and os.path.exists(os.path.join(real_board_dir, f"board{match.group(1)}.txt")):
+            yield name, int(match.group(1))
+
+
+def decode(upload, max_side):
+    """The photo as a float RGB image and the downscaled copy corners are detected on."""
+    img_rgb = np.float32(np.array(Image.open(BytesIO(upload)).convert("RGB"))) / 255.0
+    proxy, scale_xy = hough_utils.downscale(img_rgb, max_side)
+    return img_rgb, proxy, scale_xy
+
+
+def run_stages(upload, config, measure):
+    """
+    Runs the pipeline stages one by one, each through measure(stage, fn,
+    *args), which returns fn's result. Returns the detected board, or None
+    if no corners were found.
+    """
+    img_rgb, proxy, scale_xy = measure("decode", decode, upload, config["CORNER_MAX_SIDE"])
+    mask = measure("mask", hough_utils.board_mask, proxy, config["MASK_MODE"])
+    lines = measure("hough", hough_utils.detect_lines, proxy, mask)
+    if len(lines) == 0:
+        return None
+    corners = measure("clustering", hough_utils.corners_from_lines, lines, proxy.shape, config["CORNER_CLUSTERING"])
+    if corners.shape != (4, 2):
+        return None
+
+    board_state, _ = measure("cells", piece_detection_utils.detect_board, img_rgb,
+                             (corners * scale_xy).astype(np.float32))
+    for player, side in SIDES.items():
+        if optimal_positions_utils.get_valid_moves(board_state, player):
+            measure(f"search_{side}", search_position, board_state, player, config["SEARCH_MAX_TIME_BUDGET"], config)
+    return board_state
+
+
+def cold_predict(pipeline, upload, name):
+    """Pipeline.predict with the result and analysis caches emptied first."""
+    pipeline.result_cache.clear()
+    pipeline.analysis_cache.entries.clear()
+    conn = storage_utils.get_connection(pipeline.config["DB_PATH"])
+    with conn:
+        conn.execute("DELETE FROM positions")
+    return pipeline.predict(upload, name, pipeline.config["SEARCH_MAX_TIME_BUDGET"], store=False)
+
+
+def time_stage(timings):
+    def measure(stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.setdefault(stage, []).append((time.perf_counter() - start) * 1000)
+        return result
+    return measure
+
+
+def trace_stage(peaks):
+    def measure(stage, fn, *args):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn(*args)
+        peak = tracemalloc.get_traced_memory()[1] - before
+        peaks[stage] = max(peaks.get(stage, 0), peak // 1024)
+        return result
+    return measure
+
+
+def compare(report, baseline, tolerance):
+    """Returns a list of regressions of `report` against `baseline`."""
+    regressions = []
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if previous is None:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if (current[key] > previous[key] * (1 + tolerance)
+                    and current[key] - previous[key] >= MIN_REGRESSION_MS):
+                regressions.append(f"{stage} {key}: {previous[key]} -> {current[key]}")
+        if current["peak_kb"] > previous["peak_kb"] * (1 + tolerance):
+            regressions.append(f"{stage} peak_kb: {previous['peak_kb']} -> {current['peak_kb']}")
+
+    for name, current in report["accuracy"]["photos"].items():
+        previous = baseline.get("accuracy", {}).get("photos", {}).get(name)
+        if previous is not None and current["cells"] < previous["cells"]:
+            regressions.append(f"{name} cells: {previous['cells']} -> {current['cells']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("image_dir", nargs="?", default=os.path.join(ROOT, "Test_Images"))
+    parser.add_argument("--real-board-dir", default=piece_detection_utils.REAL_BOARD_DIR)
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs of every photo")
+    parser.add_argument("--depth", type=int, default=6, help="search depth")
+    parser.add_argument("--json", default=None, help="file to write the report to")
+    parser.add_argument("--baseline", default=None, help="earlier report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown or memory growth")
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix="othello-benchmark-")
+    config = {**load_config(), "PROCESS_WORKERS": 0, "SEARCH_MAX_DEPTH": args.depth,
+              "SEARCH_MAX_TIME_BUDGET": 3600.0, "DB_PATH": os.path.join(db_dir, "benchmark.db"),
+              "BLOB_DIR": os.path.join(db_dir, "images")}
+    pipeline = Pipeline(config)
+
+    uploads = []
+    for name, index in photos(args.image_dir, args.real_board_dir):
+        with open(os.path.join(args.image_dir, name), "rb") as f:
+            uploads.append((name, index, f.read()))
+    if not uploads:
+        sys.exit(f"No labelled photos in {args.image_dir}")
+
+    # Untimed first pass: traces memory, checks accuracy and warms up
+    peaks = {}
+    accuracy = {}
+    tracemalloc.start()
+    for name, index, upload in uploads:
+        board_state = run_stages(upload, config, trace_stage(peaks))
+        trace_stage(peaks)("predict", cold_predict, pipeline, upload, name)
+        cells = piece_detection_utils.compare_board_states(board_state, index, args.real_board_dir) \
+            if board_state is not None else 0
+        accuracy[name] = {"cells": cells, "accuracy": round(cells / 64 * 100, 2), "corners": board_state is not None}
+    tracemalloc.stop()
+
+    timings = {}
+    for _ in range(args.repeat):
+        for name, _, upload in uploads:
+            run_stages(upload, config, time_stage(timings))
+            time_stage(timings)("predict", cold_predict, pipeline, upload, name)
+    pipeline.close()
+
+    stages = {}
+    for stage in STAGES:
+        if stage not in timings:
+            continue
+        samples = np.array(timings[stage])
+        stages[stage] = {"samples": len(samples),
+                         "p50_ms": round(float(np.percentile(samples, 50)), 3),
+                         "p95_ms": round(float(np.percentile(samples, 95)), 3),
+                         "mean_ms": round(float(np.mean(samples)), 3),
+                         "peak_kb": int(peaks.get(stage, 0))}
+    total_cells = sum(photo["cells"] for photo in accuracy.values())
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "repeat": args.repeat,
+        "depth": args.depth,
+        "settings": {key: config[key] for key in ("MASK_MODE", "CORNER_MAX_SIDE", "CORNER_CLUSTERING", "OPENING_BOOK")},
+        "stages": stages,
+        "accuracy": {
+            "cells": round(total_cells / (64 * len(accuracy)) * 100, 2),
+            "boards": sum(photo["cells"] == 64 for photo in accuracy.values()),
+            "photos": accuracy,
+        },
+    }
+
+    print(f"{'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'peak KB':>10}")
+    for stage, row in stages.items():
+        print(f"{stage:<14}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['peak_kb']:>10}")
+    print(f"\n{'photo':<28}{'cells':>7}")
+    for name, photo in accuracy.items():
+        print(f"{name:<28}{photo['cells']:>4}/64")
+    print(f"cell accuracy {report['accuracy']['cells']}%, "
+          f"{report['accuracy']['boards']}/{len(accuracy)} boards exact")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit("Regressions against the baseline:\n" + "\n".join(regressions))
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
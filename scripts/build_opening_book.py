@@ -0,0 +1,38 @@
+"""
+Builds the opening book consulted by optimal_positions_utils.iterative_deepening:
+every position within --plies moves of the start when both sides play one of
+their --width best moves, each analysed with a --depth ply search.
+
+Usage:
+    python scripts/build_opening_book.py [--plies 10] [--depth 6] [--width 2] [--output data/opening_book.bin]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import opening_book_utils
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--plies", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--width", type=int, default=2)
+    parser.add_argument("--output", default=opening_book_utils.BOOK_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+
+    def progress(positions, ply):
+        if positions % 100 == 0:
+            print(f"{positions} positions (ply {ply}), {time.perf_counter() - start:.0f}s", flush=True)
+
+    count = opening_book_utils.build_book(args.output, args.plies, args.depth, args.width, progress)
+    print(f"Wrote {count} positions to {args.output} "
+          f"({os.path.getsize(args.output) / 1024:.0f} KB) in {time.perf_counter() - start:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
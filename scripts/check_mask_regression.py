@@ -0,0 +1,79 @@
+"""
+Regression check for hough_utils.prep_image: compares the vectorized mask
+against the original per-pixel implementation on every image in
+Test_Images/ and exits non-zero if any output differs. Also reports how
+closely the HSV mode agrees with the RGB chroma key.
+
+Usage:
+    python scripts/check_mask_regression.py [image_dir]
+"""
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import hough_utils
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Same parameters hough_utils.hough uses
+CHROMA_KEY = (0, 1, 0)
+SIGMA = 10
+THRESHOLD = 0.95
+
+
+def reference_prep_image(img, chroma_key, sigma, ksize, threshold):
+    """The original per-pixel prep_image, kept as the reference."""
+    oned_fil = cv2.getGaussianKernel(ksize, sigma)
+    twod_fil = oned_fil*np.transpose(oned_fil)
+
+    im_fil_low = img.copy()
+
+    dim = 3 if len(im_fil_low.shape) == 3 else 1
+
+    for i in range (im_fil_low.shape[0]):
+        for j in range(im_fil_low.shape[1]):
+            color = img[i][j]
+            difference = np.abs(chroma_key-color)
+            im_fil_low[i][j] = np.ones(dim) if (np.sum(difference) < threshold) else np.zeros(dim)
+
+    return np.clip(cv2.filter2D(im_fil_low,-1,twod_fil),0,1)
+
+
+def main():
+    image_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, "Test_Images")
+    failures = 0
+    for name in sorted(os.listdir(image_dir)):
+        if not name.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
+        img = np.float32(np.array(Image.open(os.path.join(image_dir, name)).convert("RGB"))) / 255.0
+        ksize = int(img.shape[0] / 10)
+
+        start = time.perf_counter()
+        expected = reference_prep_image(img, CHROMA_KEY, SIGMA, ksize, THRESHOLD)
+        reference_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = hough_utils.prep_image(img, CHROMA_KEY, SIGMA, ksize, THRESHOLD)
+        vectorized_time = time.perf_counter() - start
+
+        hsv = hough_utils.prep_image(img, CHROMA_KEY, SIGMA, ksize, THRESHOLD, mode="hsv")
+        hsv_agreement = np.mean((hsv[..., 0] > 0.5) == (actual[..., 0] > 0.5)) * 100
+
+        identical = actual.dtype == expected.dtype and np.array_equal(actual, expected)
+        failures += not identical
+        print(f"{'OK  ' if identical else 'FAIL'} {name}: reference {reference_time:.2f}s, "
+              f"vectorized {vectorized_time * 1000:.1f}ms, "
+              f"max diff {np.max(np.abs(actual - expected)):.2e}, "
+              f"hsv agreement {hsv_agreement:.1f}%")
+
+    if failures:
+        sys.exit(f"{failures} image(s) differ from the reference implementation")
+
+
+if __name__ == "__main__":
+    main()
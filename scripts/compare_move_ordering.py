@@ -0,0 +1,128 @@
+"""
+Compares alpha-beta node counts with and without move ordering / PVS on a
+fixed set of positions, so the pruning gain can be measured.
+
+Usage:
+    python scripts/compare_move_ordering.py [--depth 6]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import bitboard_utils as bb
+from utils import optimal_positions_utils
+from utils.transposition_utils import TranspositionTable, zobrist_hash
+
+# B = black, W = white, . = empty; row 0 first
+POSITIONS = {
+    "opening": [
+        "........",
+        "........",
+        "........",
+        "...WB...",
+        "...BW...",
+        "........",
+        "........",
+        "........",
+    ],
+    "ply12": [
+        "........",
+        ".W.B....",
+        "..WB.BW.",
+        "..BBBW..",
+        "...BWB..",
+        "...B.W..",
+        "..B.....",
+        "........",
+    ],
+    "ply20": [
+        "......WB",
+        "..W...BB",
+        "..W.WBWW",
+        ".BWWBBB.",
+        "B.WWW...",
+        "..W.BW..",
+        ".W......",
+        "........",
+    ],
+    "ply28": [
+        "....WB..",
+        ".B..BW..",
+        "..BBWBW.",
+        ".WBWBB.W",
+        "W.WBBBW.",
+        ".W.WBB.B",
+        "..W.B.B.",
+        ".W..B...",
+    ],
+    "ply36": [
+        "WBBBB...",
+        ".BBBB.B.",
+        ".BWWWBWW",
+        ".WBWBW..",
+        "W.BWWWB.",
+        "..BWWW..",
+        ".B.WWBB.",
+        "....W.BB",
+    ],
+    "ply44": [
+        "BW.....B",
+        ".WWWWWB.",
+        "WWBWWB..",
+        "BBWBWBB.",
+        "BBWBWWB.",
+        "BBBWWWBB",
+        "BBBWWBBB",
+        "B.....BW",
+    ],
+}
+
+
+def parse_position(rows):
+    white = black = 0
+    for row, line in enumerate(rows):
+        for col, cell in enumerate(line):
+            if cell == "W":
+                white |= 1 << bb.square(row, col)
+            elif cell == "B":
+                black |= 1 << bb.square(row, col)
+    return white, black
+
+
+def run_search(white, black, player, depth, ordering):
+    own, opp = bb.split_by_player(white, black, player)
+    ctx = optimal_positions_utils.SearchContext(TranspositionTable(1 << 16), ordering=ordering)
+    start = time.perf_counter()
+    score, _ = optimal_positions_utils.negamax(
+        own, opp, player, depth, float('-inf'), float('inf'), ctx, zobrist_hash(white, black, player)
+    )
+    return score, ctx.nodes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--depth", type=int, default=6)
+    args = parser.parse_args()
+
+    print(f"{'position':<10}{'side':<7}{'unordered':>12}{'ordered':>12}{'ratio':>8}{'s unord':>8}{'s ord':>8}")
+    total_plain = total_ordered = 0
+    for name, rows in POSITIONS.items():
+        white, black = parse_position(rows)
+        for player, side in ((1, "white"), (-1, "black")):
+            if not bb.get_moves(*bb.split_by_player(white, black, player)):
+                continue
+            plain_score, plain_nodes, plain_time = run_search(white, black, player, args.depth, False)
+            score, nodes, elapsed = run_search(white, black, player, args.depth, True)
+            if score != plain_score:
+                raise SystemExit(f"{name}/{side}: scores differ ({plain_score} vs {score})")
+            total_plain += plain_nodes
+            total_ordered += nodes
+            print(f"{name:<10}{side:<7}{plain_nodes:>12}{nodes:>12}{plain_nodes / nodes:>8.2f}"
+                  f"{plain_time:>8.2f}{elapsed:>8.2f}")
+    print(f"{'total':<17}{total_plain:>12}{total_ordered:>12}{total_plain / total_ordered:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
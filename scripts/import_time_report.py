@@ -0,0 +1,108 @@
+"""
+Measures how long the backend modules take to import, using
+`python -X importtime` in a fresh interpreter for every run, and lists the
+heaviest packages each one pulls in. Exits non-zero if a module loads one
+of the optional dependencies that must stay lazy (plotting, scikit-learn,
+SciPy) or if an import is slower than --max-ms.
+
+Usage:
+    python scripts/import_time_report.py [--runs 5] [--max-ms 1500] [--top 8] [--json report.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Modules imported by a gunicorn worker / `python backend/app.py`
+TARGETS = [
+    "utils.hough_utils",
+    "utils.piece_detection_utils",
+    "utils.optimal_positions_utils",
+    "app",
+]
+
+# Optional dependencies that must only load on demand
+LAZY_PACKAGES = ["matplotlib", "sklearn", "scipy"]
+
+
+def import_times(module):
+    """Imports module in a fresh interpreter and returns {module: cumulative us}."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ROOT, os.path.join(ROOT, "backend")])
+    with tempfile.TemporaryDirectory(prefix="othello-import-") as scratch:
+        # Keep the repository's database untouched and no worker pool in the timings
+        env["OTHELLO_DB_PATH"] = os.path.join(scratch, "submissions.db")
+        env["OTHELLO_BLOB_DIR"] = os.path.join(scratch, "images")
+        env["OTHELLO_PROCESS_WORKERS"] = "0"
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=scratch, env=env, capture_output=True, text=True
+        )
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # One separator space, then two spaces of indentation per nesting level
+        times[name[1:].rstrip()] = int(cumulative)
+    return times
+
+
+def report(module, runs, top):
+    samples = [import_times(module) for _ in range(runs)]
+    total_ms = statistics.median(s[module] for s in samples) / 1000
+
+    # Heaviest packages imported directly by the module (one nesting level)
+    packages = {}
+    for name in samples[0]:
+        if len(name) - len(name.lstrip()) == 2:
+            packages[name.strip()] = statistics.median(s.get(name, 0) for s in samples) / 1000
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+    loaded = set().union(*samples)
+    lazy_loaded = sorted(p for p in LAZY_PACKAGES if any(n.strip() == p for n in loaded))
+    return {"module": module, "total_ms": round(total_ms, 1),
+            "heaviest": [[name, round(ms, 1)] for name, ms in heaviest],
+            "lazy_loaded": lazy_loaded}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--json", default=None)
+    args = parser.parse_args()
+
+    results = []
+    failures = []
+    for module in TARGETS:
+        result = report(module, args.runs, args.top)
+        results.append(result)
+        print(f"{module}: {result['total_ms']:.1f}ms (median of {args.runs})")
+        for name, ms in result["heaviest"]:
+            print(f"    {ms:8.1f}ms  {name}")
+        if result["lazy_loaded"]:
+            failures.append(f"{module} imports {', '.join(result['lazy_loaded'])} at startup")
+        if args.max_ms is not None and result["total_ms"] > args.max_ms:
+            failures.append(f"{module} took {result['total_ms']:.1f}ms (limit {args.max_ms}ms)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
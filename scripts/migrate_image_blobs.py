@@ -0,0 +1,41 @@
+"""
+Upgrades a submissions database to the current schema and moves images
+stored as base64 TEXT into the content-addressed image store, then
+vacuums the database to give the space back. Safe to interrupt and rerun.
+
+Usage:
+    python scripts/migrate_image_blobs.py [submissions.db] [--blob-dir submission_images]
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import storage_utils
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db", nargs="?", default=storage_utils.DB_PATH)
+    parser.add_argument("--blob-dir", default=storage_utils.BLOB_DIR)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"{args.db} does not exist")
+
+    size_before = os.path.getsize(args.db)
+    storage_utils.init_db(args.db)
+    moved = storage_utils.migrate_legacy_images(args.db, args.blob_dir)
+
+    conn = storage_utils.get_connection(args.db)
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    storage_utils.close_connections()
+
+    size_after = os.path.getsize(args.db)
+    print(f"Moved images of {moved} submission(s) to {args.blob_dir}/")
+    print(f"{args.db}: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Runs the /predict pipeline over every image in a directory, several images
+at a time, and writes one JSON line per image (NDJSON) as each finishes.
+Settings come from the same OTHELLO_* environment variables as the server.
+
+Usage:
+    python scripts/predict_batch.py [image_dir] [--workers 4] [--time-budget 1.0]
+                                    [--output results.ndjson] [--include-image] [--store]
+                                    [--format png] [--quality 85]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import metrics_utils
+from utils.pipeline_utils import Pipeline, json_response, load_config
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("image_dir", nargs="?", default=os.path.join(ROOT, "Test_Images"))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--time-budget", type=float, default=None)
+    parser.add_argument("--output", default=None, help="NDJSON file to write instead of stdout")
+    parser.add_argument("--include-image", action="store_true", help="keep the base64 annotated image in each line")
+    parser.add_argument("--format", default=None, help="annotated image format: png, jpeg or webp")
+    parser.add_argument("--quality", type=int, default=None, help="JPEG/WebP quality")
+    parser.add_argument("--store", action="store_true", help="save each result to the submissions database")
+    args = parser.parse_args()
+
+    names = sorted(n for n in os.listdir(args.image_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+    uploads = []
+    for name in names:
+        with open(os.path.join(args.image_dir, name), "rb") as f:
+            uploads.append((name, f.read()))
+
+    # Logs go to stderr; send file descriptor 1 there too so stdout only carries
+    # the results, whatever the native libraries of the workers print
+    sys.stdout.flush()
+    out = open(args.output, "w") if args.output else os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+
+    start = time.perf_counter()
+    config = load_config()
+    metrics_utils.configure_logging(config["LOG_LEVEL"])
+    pipeline = Pipeline(config)
+    output = pipeline.output_options(args.format, args.quality, args.include_image or args.store)
+    results = pipeline.predict_many(uploads, args.time_budget, args.store, args.workers, output)
+    for index, filename, response, status in results:
+        if not args.include_image:
+            response.pop("image", None)
+        line = {"index": index, "filename": filename, "status": status, **json_response(response)}
+        out.write(json.dumps(line) + "\n")
+        out.flush()
+    pipeline.close()
+    print(f"Analysed {len(uploads)} image(s) in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Follows a board through a video file or a camera with the live stream
+tracker (see utils/stream_utils.py) and writes one JSON line (NDJSON) for
+every frame where the board changed or could not be found. Settings come
+from the same OTHELLO_* environment variables as the server.
+
+Usage:
+    python scripts/track_video.py game.mp4 [--every 1] [--time-budget 1.0] [--all]
+    python scripts/track_video.py 0          # first camera
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import metrics_utils
+from utils.pipeline_utils import Pipeline, load_config
+from utils.stream_utils import BoardTracker
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", help="video file, or camera index")
+    parser.add_argument("--every", type=int, default=1, help="analyse every n-th frame")
+    parser.add_argument("--time-budget", type=float, default=None)
+    parser.add_argument("--all", action="store_true", help="write a line for every analysed frame")
+    args = parser.parse_args()
+
+    capture = cv2.VideoCapture(int(args.source) if args.source.isdigit() else args.source)
+    if not capture.isOpened():
+        sys.exit(f"Cannot open {args.source}")
+
+    config = load_config()
+    metrics_utils.configure_logging(config["LOG_LEVEL"])
+    pipeline = Pipeline(config)
+    tracker = BoardTracker(pipeline, pipeline.time_budget(args.time_budget))
+
+    start = time.perf_counter()
+    index = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            index += 1
+            if (index - 1) % args.every:
+                continue
+            result = tracker.update(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if args.all or result.get("board_changed") or "error" in result:
+                print(json.dumps({"video_frame": index, **result}), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.release()
+        pipeline.close()
+
+    stats = tracker.stats()
+    elapsed = time.perf_counter() - start
+    print(f"{stats['frames']} frame(s) in {elapsed:.1f}s ({stats['frames'] / max(elapsed, 1e-9):.1f} fps), "
+          f"{stats['hough_runs']} Hough run(s), {stats['searches']} search(es)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import bitboard_utils as bb
+from utils import storage_utils
+
+# The 8 symmetries of the square (4 rotations, each optionally mirrored) as
+# square permutations: a position transformed by t has on square s whatever
+# the original had on square PERMUTATIONS[t][s]. Board orientation in a photo
+# is arbitrary, so all 8 transforms of a position share one cache entry.
+_squares = np.arange(64).reshape(8, 8)
+PERMUTATIONS = [
+    tuple(int(sq) for sq in np.rot90(grid, k).reshape(64))
+    for grid in (_squares, np.fliplr(_squares))
+    for k in range(4)
+]
+
+
+def transform(bitboard, permutation):
+    """Applies a square permutation to a bitboard."""
+    result = 0
+    for sq, source in enumerate(permutation):
+        if bitboard >> source & 1:
+            result |= 1 << sq
+    return result
+
+
+def canonicalize(white, black):
+    """
+    Returns (white, black, permutation) for the smallest of the 8 symmetric
+    variants of the position. A square s of the canonical position is square
+    permutation[s] of the original.
+    """
+    return min(
+        (transform(white, p), transform(black, p), p) for p in PERMUTATIONS
+    )
+
+
+class AnalysisCache:
+    """
+    Cache of search results keyed on the position and side to move, so
+    photos that decode to the same board (or a rotated or mirrored copy of
+    it) reuse the analysis instead of searching again.
+
+    Positions are stored in canonical form (see canonicalize) in an
+    in-memory LRU of `capacity` entries backed by the positions table of the
+    submissions database, so entries survive restarts. An entry is reused if
+    it was solved exactly or came from a search with at least the requested
+    time budget; otherwise the position is searched again and the deeper
+    result replaces it.
+    """
+
+    def __init__(self, capacity=4096, db_path=storage_utils.DB_PATH):
+        self.capacity = capacity
+        self.db_path = db_path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(white, black, player):
+        return f"{white:016x}{black:016x}", player
+
+    def get(self, board, player, time_budget):
+        """
+        Returns an iterative_deepening style result dict (with cached: True)
+        for `player` to move on `board`, or None if there is no usable entry.
+        """
+        white, black = bb.from_board(board)
+        canonical_white, canonical_black, permutation = canonicalize(white, black)
+        key = self.key(canonical_white, canonical_black, player)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None:
+            entry = storage_utils.get_position_analysis(*key, path=self.db_path)
+            if entry is not None:
+                self._remember(key, entry)
+
+        usable = entry is not None and (entry["exact"] or entry["time_budget"] >= time_budget)
+        with self.lock:
+            if usable:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not usable:
+            return None
+
+        best_move = None
+        if entry["best_move"] is not None:
+            best_move = bb.square_to_move(permutation[entry["best_move"]])
+        return {"best_move": best_move, "score": entry["score"], "depth": entry["depth"],
+                "exact": entry["exact"], "nodes": 0, "cutoffs": 0, "elapsed": 0.0,
+                "cached": True}
+
+    def put(self, board, player, time_budget, result):
+        """Stores an iterative_deepening result unless a deeper one is cached."""
+        white, black = bb.from_board(board)
+        canonical_white, canonical_black, permutation = canonicalize(white, black)
+        key = self.key(canonical_white, canonical_black, player)
+
+        best_move = None
+        if result["best_move"] is not None:
+            best_move = permutation.index(bb.square(*result["best_move"]))
+        entry = {"best_move": best_move, "score": result["score"], "depth": result["depth"],
+                 "exact": result["exact"], "time_budget": time_budget}
+
+        with self.lock:
+            current = self.entries.get(key)
+        if current is not None and (current["exact"] or current["depth"] > entry["depth"]):
+            return
+        self._remember(key, entry)
+        storage_utils.save_position_analysis(*key, entry, path=self.db_path)
+
+    def _remember(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
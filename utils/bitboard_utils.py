@@ -0,0 +1,147 @@
+import numpy as np
+
+# Bitboard representation of an Othello position.
+#
+# Each side is a 64-bit integer where bit (row * 8 + col) is set if that side
+# has a disc on (row, col). Row 0 / col 0 is the top-left of the 8x8
+# board_state array used by the rest of the pipeline (1 = white, -1 = black).
+
+FULL = 0xFFFFFFFFFFFFFFFF
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:  # Python < 3.10
+    def popcount(bb):
+        return bin(bb).count("1")
+
+
+def square(row, col):
+    return row * 8 + col
+
+
+def square_to_move(sq):
+    return divmod(sq, 8)
+
+
+def iter_squares(bb):
+    """Yields the index of every set bit, lowest first."""
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+# Opponent discs that a run can pass through horizontally or diagonally: a run
+# never crosses the edge columns, so masking them out stops runs wrapping
+# around to the next row and the per-step wrap masks are not needed
+INNER_COLS = 0x7E7E7E7E7E7E7E7E
+
+# Shift amount and whether runs in that axis use INNER_COLS; each axis is
+# walked in both directions (<< and >>)
+AXES = ((1, True), (8, False), (7, True), (9, True))
+
+
+def get_moves(own, opp):
+    """
+    Returns a bitboard of every legal move for the side owning `own`.
+
+    Uses the shift-and-mask fill: in each direction, grow a run of opponent
+    discs starting next to our own discs, then one more step onto an empty
+    square is a legal move.
+    """
+    empty = ~(own | opp) & FULL
+    inner = opp & INNER_COLS
+    moves = 0
+    for amount, use_inner in AXES:
+        o = inner if use_inner else opp
+        double = amount + amount
+        # Runs of up to 2 discs, then extend by pairs of opponent discs: a
+        # run can be at most 6 discs long on an 8-wide board
+        pairs = o & (o << amount)
+        run = o & (own << amount)
+        run |= o & (run << amount)
+        run |= pairs & (run << double)
+        run |= pairs & (run << double)
+        moves |= run << amount
+        pairs = o & (o >> amount)
+        run = o & (own >> amount)
+        run |= o & (run >> amount)
+        run |= pairs & (run >> double)
+        run |= pairs & (run >> double)
+        moves |= run >> amount
+    return moves & empty
+
+
+def get_flips(own, opp, sq):
+    """Returns the bitboard of opponent discs flipped by playing on `sq`."""
+    move = 1 << sq
+    inner = opp & INNER_COLS
+    flips = 0
+    for amount, use_inner in AXES:
+        o = inner if use_inner else opp
+        run = 0
+        cur = move << amount
+        while cur & o:
+            run |= cur
+            cur <<= amount
+        if cur & own:
+            flips |= run
+        run = 0
+        cur = move >> amount
+        while cur & o:
+            run |= cur
+            cur >>= amount
+        if cur & own:
+            flips |= run
+    return flips
+
+
+def make_move(own, opp, sq):
+    """
+    Plays `sq` for the side owning `own`.
+
+    Returns:
+    - new_own: Mover's discs after the move
+    - new_opp: Opponent's discs after the move
+    """
+    flips = get_flips(own, opp, sq)
+    return own | flips | (1 << sq), opp ^ flips
+
+
+def from_board(board):
+    """
+    Converts an 8x8 board_state array into bitboards.
+
+    Returns:
+    - white: Bitboard of white discs (represented as 1)
+    - black: Bitboard of black discs (represented as -1)
+    """
+    board = np.asarray(board)
+    weights = 1 << np.arange(64, dtype=np.uint64)
+    flat = board.reshape(64)
+    white = int(np.sum(weights[flat == 1], dtype=np.uint64))
+    black = int(np.sum(weights[flat == -1], dtype=np.uint64))
+    return white, black
+
+
+def to_board(white, black):
+    """Converts bitboards back into an 8x8 float board_state array."""
+    bits = np.arange(64, dtype=np.uint64)
+    white_cells = (np.uint64(white) >> bits) & np.uint64(1)
+    black_cells = (np.uint64(black) >> bits) & np.uint64(1)
+    board = white_cells.astype(np.float64) - black_cells.astype(np.float64)
+    return board.reshape(8, 8)
+
+
+def split_by_player(white, black, player):
+    """Returns (own, opp) for `player` (1 for white, -1 for black)."""
+    if player == 1:
+        return white, black
+    return black, white
+
+
+def join_by_player(own, opp, player):
+    """Inverse of split_by_player: returns (white, black)."""
+    if player == 1:
+        return own, opp
+    return opp, own
@@ -0,0 +1,168 @@
+from utils import bitboard_utils as bb
+from utils.transposition_utils import EXACT, LOWER, UPPER, update_hash, pass_hash
+
+# Exact endgame solver. Once few enough squares are empty the game tree can be
+# searched to the end, which gives the exact final disc differential instead
+# of a heuristic score. The solver searches to the end of the game regardless
+# of depth, so it only makes sense below ENDGAME_EMPTIES empty squares.
+
+# Default number of empty squares at or below which /predict solves exactly.
+# 12 empties usually solves in well under a second here; larger thresholds
+# need a larger time budget (the search falls back to the heuristic result if
+# the solver runs out of time)
+ENDGAME_EMPTIES = 12
+
+# Above this many empties moves are ordered fastest-first (fewest opponent
+# replies first); below it the cheaper parity ordering alone is used
+FASTEST_FIRST_EMPTIES = 7
+
+# Only probe the transposition table above this many empties; near the leaves
+# hashing costs more than it saves
+TT_MIN_EMPTIES = 9
+
+# Parity regions: the four 4x4 quadrants. A region with an odd number of empty
+# squares is one where we can get the last move, so moves there go first.
+QUADRANTS = (
+    0x000000000F0F0F0F,
+    0x00000000F0F0F0F0,
+    0x0F0F0F0F00000000,
+    0xF0F0F0F000000000,
+)
+
+
+def odd_regions(empty):
+    """Returns the union of the quadrants holding an odd number of empty squares."""
+    mask = 0
+    for quadrant in QUADRANTS:
+        if bb.popcount(empty & quadrant) & 1:
+            mask |= quadrant
+    return mask
+
+
+def final_score(own, opp):
+    """Disc differential at the end of the game, from the side to move."""
+    return bb.popcount(own) - bb.popcount(opp)
+
+
+def order_endgame_moves(own, opp, moves, empties, hash_move=None):
+    """
+    Returns [(sq, new_own, new_opp), ...] in search order: the hash move,
+    then, above FASTEST_FIRST_EMPTIES, moves leaving the opponent the fewest
+    replies, with moves in odd parity regions first among equals.
+    """
+    odd = odd_regions(~(own | opp) & bb.FULL)
+    children = []
+    for sq in bb.iter_squares(moves):
+        flips = bb.get_flips(own, opp, sq)
+        new_own, new_opp = own | flips | (1 << sq), opp ^ flips
+        if sq == hash_move:
+            key = -1
+        elif empties > FASTEST_FIRST_EMPTIES:
+            key = bb.popcount(bb.get_moves(new_opp, new_own)) * 2 + (0 if odd >> sq & 1 else 1)
+        else:
+            key = 0 if odd >> sq & 1 else 1
+        children.append((key, sq, new_own, new_opp))
+    children.sort()
+    return [child[1:] for child in children]
+
+
+def solve(own, opp, player, ctx, h=0, alpha=-64, beta=64):
+    """
+    Solves the position to the end of the game with alpha-beta search.
+
+    `own`/`opp` are the bitboards of the side to move (`player`) and its
+    opponent, `ctx` an optimal_positions_utils.SearchContext (its deadline
+    applies, so this can raise SearchTimeout) and `h` the Zobrist hash of the
+    position, used when ctx has a transposition table.
+
+    Returns (score, best_move): the exact final disc differential from the
+    side to move's point of view under perfect play, and the square that
+    achieves it (None if the side to move has to pass).
+    """
+    ctx.visit()
+    moves = bb.get_moves(own, opp)
+    if not moves:
+        if not bb.get_moves(opp, own):
+            return final_score(own, opp), None
+        score, _ = solve(opp, own, -player, ctx, pass_hash(h), -beta, -alpha)
+        return -score, None
+
+    empties = 64 - bb.popcount(own | opp)
+    tt = ctx.tt if empties >= TT_MIN_EMPTIES else None
+    hash_move = None
+    if tt is not None:
+        entry = tt.probe(h)
+        if entry is not None:
+            _, entry_depth, flag, score, hash_move, _, _ = entry
+            # A search at least `empties` deep reaches the end of every line,
+            # so its score is exact whether it came from here or the midgame
+            if entry_depth >= empties:
+                if flag == EXACT:
+                    return score, hash_move
+                if flag == LOWER:
+                    alpha = max(alpha, score)
+                elif flag == UPPER:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score, hash_move
+    alpha_orig = alpha
+
+    best_score = -65
+    best_move = None
+    for sq, new_own, new_opp in order_endgame_moves(own, opp, moves, empties, hash_move):
+        child_h = update_hash(h, player, sq, (opp ^ new_opp)) if tt is not None else 0
+        if best_move is None:
+            score = -_solve_score(new_opp, new_own, -player, ctx, child_h, -beta, -alpha, empties - 1)
+        else:
+            # Null-window test first; only re-search if the move is better
+            score = -_solve_score(new_opp, new_own, -player, ctx, child_h, -alpha - 1, -alpha, empties - 1)
+            if alpha < score < beta:
+                score = -_solve_score(new_opp, new_own, -player, ctx, child_h, -beta, -score, empties - 1)
+        if score > best_score:
+            best_score, best_move = score, sq
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+
+    if tt is not None:
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        tt.store(h, empties, flag, best_score, best_move)
+
+    return best_score, best_move
+
+
+def _solve_score(own, opp, player, ctx, h, alpha, beta, empties):
+    """Score-only version of solve for inner nodes."""
+    if empties >= TT_MIN_EMPTIES:
+        return solve(own, opp, player, ctx, h, alpha, beta)[0]
+
+    # Near the leaves: no hashing, no table, parity ordering only
+    ctx.visit()
+    moves = bb.get_moves(own, opp)
+    if not moves:
+        if not bb.get_moves(opp, own):
+            return final_score(own, opp)
+        return -_solve_score(opp, own, -player, ctx, h, -beta, -alpha, empties)
+
+    if empties == 1:
+        # Only one square left and we can play it
+        sq = moves.bit_length() - 1
+        flips = bb.get_flips(own, opp, sq)
+        return final_score(own | flips | (1 << sq), opp ^ flips)
+
+    best_score = -65
+    for _, new_own, new_opp in order_endgame_moves(own, opp, moves, empties):
+        score = -_solve_score(new_opp, new_own, -player, ctx, 0, -beta, -alpha, empties - 1)
+        if score > best_score:
+            best_score = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+    return best_score
@@ -0,0 +1,252 @@
+import logging
+import re
+import time
+
+import numpy as np
+
+from utils import bitboard_utils as bb
+from utils import endgame_utils, metrics_utils, optimal_positions_utils
+from utils.metrics_utils import span
+from utils.opening_book_utils import starting_position
+from utils.pipeline_utils import SIDES
+from utils.transposition_utils import TranspositionTable, zobrist_hash
+
+logger = logging.getLogger(__name__)
+
+# Whole-game analysis: every move of a finished (or unfinished) game is
+# compared with the best move in the position it was played from. The plies
+# are cut into runs of consecutive moves and each run is analysed on one
+# worker process with a single transposition table, so the search of a
+# position starts from what the searches of the positions before it already
+# stored: the played move of one ply is the root of the next, and its subtree
+# was searched one ply shallower moments ago. The runs are independent and
+# are analysed at the same time on the pipeline's worker pool.
+
+# Fewest plies in a run; shorter runs would lose more warm table entries at
+# their boundaries than the extra parallelism gains
+MIN_RUN_PLIES = 4
+
+# Runs per worker process. Endgame plies cost far more than opening plies, so
+# more runs than workers keep the workers busy until the end; the runs are
+# also queued last first, so the expensive endgame starts straight away
+RUNS_PER_WORKER = 2
+
+COLUMNS = "abcdefgh"
+MOVE_PATTERN = re.compile(r"([a-h])([1-8])", re.IGNORECASE)
+
+
+def move_name(sq):
+    """Square index as a move in the usual notation, e.g. f5 (column a-h, row 1-8)."""
+    row, col = bb.square_to_move(sq)
+    return f"{COLUMNS[col]}{row + 1}"
+
+
+def parse_moves(moves):
+    """
+    Squares of the moves in `moves`: a string such as "f5d6c3" (separators
+    and case are ignored, as is "pass") or a list of such moves. Raises
+    ValueError on anything else.
+    """
+    if isinstance(moves, (list, tuple)):
+        moves = " ".join(str(move) for move in moves)
+    if not isinstance(moves, str):
+        raise ValueError("moves must be a string or a list of moves")
+    text = re.sub(r"pass|--|[\s,;.]", "", moves, flags=re.IGNORECASE)
+    squares = []
+    position = 0
+    for match in MOVE_PATTERN.finditer(text):
+        if match.start() != position:
+            break
+        squares.append(bb.square(int(match.group(2)) - 1, COLUMNS.index(match.group(1).lower())))
+        position = match.end()
+    if position != len(text):
+        raise ValueError(f"cannot read the move at {text[position:position + 2]!r}")
+    return squares
+
+
+def replay_moves(squares):
+    """
+    Plays `squares` from the starting position, black first, and returns
+    the plies as (white, black, player, square) before each move. A side
+    without a legal move passes. Raises ValueError at the first illegal move.
+    """
+    white, black = starting_position()
+    player = -1
+    plies = []
+    for number, sq in enumerate(squares, 1):
+        own, opp = bb.split_by_player(white, black, player)
+        if not bb.get_moves(own, opp) and bb.get_moves(opp, own):
+            player = -player
+            own, opp = opp, own
+        if not bb.get_moves(own, opp) >> sq & 1:
+            raise ValueError(f"move {number} ({move_name(sq)}) is not legal for {SIDES[player]}")
+        plies.append((white, black, player, sq))
+        white, black = bb.join_by_player(*bb.make_move(own, opp, sq), player)
+        player = -player
+    return plies
+
+
+def plies_from_boards(boards):
+    """
+    The plies between consecutive board states (8x8, 1 = white, -1 = black,
+    0 = empty), one move apart, as in replay_moves. The side of each move is
+    the colour of the disc it placed. Raises ValueError if two boards are
+    not one legal move apart.
+    """
+    if not isinstance(boards, (list, tuple)):
+        raise ValueError("boards must be a list of board states")
+    plies = []
+    for number, (before, after) in enumerate(zip(boards, boards[1:]), 1):
+        for index, board in ((number, before), (number + 1, after)):
+            if np.shape(board) != (8, 8) or not np.isin(board, (-1, 0, 1)).all():
+                raise ValueError(f"board {index} is not an 8x8 board of -1, 0 and 1")
+        before, after = np.array(before), np.array(after)
+        white, black = bb.from_board(before)
+        placed = np.argwhere((before == 0) & (after != 0))
+        if len(placed) != 1:
+            raise ValueError(f"boards {number} and {number + 1} are not one move apart")
+        row, col = placed[0]
+        player = int(after[row, col])
+        sq = bb.square(int(row), int(col))
+        own, opp = bb.split_by_player(white, black, player)
+        if not bb.get_moves(own, opp) >> sq & 1:
+            raise ValueError(f"move {number} ({move_name(sq)}) is not legal for {SIDES[player]}")
+        if not np.array_equal(bb.to_board(*bb.join_by_player(*bb.make_move(own, opp, sq), player)), after):
+            raise ValueError(f"board {number + 1} does not follow from board {number} by {move_name(sq)}")
+        plies.append((white, black, player, sq))
+    return plies
+
+
+def played_move_score(own, opp, player, sq, depth, exact, ctx):
+    """
+    Score of playing `sq` for the side to move, searched as deep as the
+    best move was: solved to the end of the game when that was exact,
+    otherwise `depth` - 1 plies below the move.
+    """
+    white, black = bb.join_by_player(*bb.make_move(own, opp, sq), player)
+    new_opp, new_own = bb.split_by_player(white, black, -player)
+    h = zobrist_hash(white, black, -player)
+    if exact:
+        score, _ = endgame_utils.solve(new_opp, new_own, -player, ctx, h)
+    else:
+        score, _ = optimal_positions_utils.negamax(
+            new_opp, new_own, -player, depth - 1, float('-inf'), float('inf'), ctx, h, 1)
+    return -score
+
+
+def analyse_plies(plies, first, depth, time_budget, blunder_threshold, tt_size, endgame_empties):
+    """
+    Worker job: analyses consecutive plies (see replay_moves), numbered from
+    `first`, in order with one transposition table. Each ply searches the
+    best move up to `depth` plies deep or for `time_budget` seconds, then
+    the played move if it differs. Returns the ply reports.
+    """
+    tt = TranspositionTable(tt_size)
+    reports = []
+    for number, (white, black, player, sq) in enumerate(plies, first):
+        with span("game_ply", side=SIDES[player]) as attributes:
+            tt.new_search()
+            board = bb.to_board(white, black)
+            result = optimal_positions_utils.iterative_deepening(
+                board, player, time_budget, depth, tt, endgame_empties)
+            best_sq = bb.square(*result["best_move"])
+            best_score = result["score"] * player  # from the mover's point of view
+
+            nodes = result["nodes"]
+            if sq == best_sq:
+                played_score = best_score
+            else:
+                own, opp = bb.split_by_player(white, black, player)
+                ctx = optimal_positions_utils.SearchContext(tt)
+                played_score = played_move_score(own, opp, player, sq, max(result["depth"], 1),
+                                                 result["exact"], ctx)
+                nodes += ctx.nodes
+            loss = max(best_score - played_score, 0)
+            attributes.update(depth=result["depth"], nodes=nodes)
+
+        reports.append({
+            "ply": number,
+            "player": SIDES[player],
+            "move": move_name(sq),
+            "square": list(bb.square_to_move(sq)),
+            "best_move": move_name(best_sq),
+            "best_square": list(result["best_move"]),
+            # White - black, as everywhere else
+            "best_score": best_score * player,
+            "played_score": played_score * player,
+            "loss": loss,
+            "blunder": loss >= blunder_threshold,
+            "depth": result["depth"],
+            "exact": result["exact"],
+            "nodes": nodes,
+            "elapsed_ms": round(result["elapsed"] * 1000, 1),
+        })
+    return reports
+
+
+def split_runs(plies, runs):
+    """Cuts plies into at most `runs` runs of consecutive plies, returned as (first ply number, plies)."""
+    runs = max(1, min(runs, len(plies) // MIN_RUN_PLIES))
+    bounds = np.linspace(0, len(plies), runs + 1).astype(int)
+    return [(int(start) + 1, plies[start:end]) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def summarise(reports):
+    """Per side: moves, blunders, total and average loss."""
+    summary = {}
+    for side in SIDES.values():
+        played = [report for report in reports if report["player"] == side]
+        total = sum(report["loss"] for report in played)
+        summary[side] = {
+            "moves": len(played),
+            "blunders": sum(report["blunder"] for report in played),
+            "total_loss": total,
+            "average_loss": round(total / len(played), 2) if played else 0.0,
+        }
+    return summary
+
+
+def analyse_game(pipeline, plies, depth=None, time_budget=None):
+    """
+    Analyses every ply of a game on `pipeline`'s worker pool. `depth` and
+    `time_budget` (seconds per ply) default to GAME_DEPTH and
+    SEARCH_TIME_BUDGET and are capped like a /predict search. Returns a
+    dict with the ply reports in order, a summary per side, the final
+    position and the time taken.
+    """
+    config = pipeline.config
+    start = time.perf_counter()
+    depth = config["GAME_DEPTH"] if depth is None else max(int(depth), 1)
+    if config["SEARCH_MAX_DEPTH"] is not None:
+        depth = min(depth, config["SEARCH_MAX_DEPTH"])
+    time_budget = pipeline.time_budget(time_budget)
+
+    # Without worker processes one run keeps the whole game warm
+    runs = split_runs(plies, pipeline.pool.workers * RUNS_PER_WORKER or 1) if plies else []
+    futures = {first: pipeline.pool.submit(metrics_utils.call_traced, analyse_plies, run, first, depth, time_budget,
+                                           config["BLUNDER_THRESHOLD"], config["TT_SIZE"], config["ENDGAME_EMPTIES"])
+               for first, run in reversed(runs)}
+    reports = []
+    for first, _ in runs:
+        run_reports, spans = pipeline.pool.result(futures[first])
+        metrics_utils.add_spans(spans)
+        reports.extend(run_reports)
+
+    if plies:
+        white, black, player, sq = plies[-1]
+        own, opp = bb.split_by_player(white, black, player)
+        white, black = bb.join_by_player(*bb.make_move(own, opp, sq), player)
+    else:
+        white, black = starting_position()
+    elapsed = time.perf_counter() - start
+    logger.info("Analysed %d plies at depth %d in %.2fs over %d run(s)", len(plies), depth, elapsed, len(runs))
+    return {
+        "plies": reports,
+        "summary": summarise(reports),
+        "final_board": bb.to_board(white, black).astype(int).tolist(),
+        "white_score": bb.popcount(white),
+        "black_score": bb.popcount(black),
+        "depth": depth,
+        "runs": len(runs),
+        "elapsed_ms": round(elapsed * 1000, 1),
+    }
@@ -1,77 +1,203 @@
-from os import path
-import math
+import logging
+from itertools import combinations
 
 # Third-Party Imports
 import cv2
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy.interpolate import griddata
-from sklearn.cluster import DBSCAN as db
-from itertools import combinations
-from sklearn.cluster import KMeans
+
+from utils.metrics_utils import span
+
+logger = logging.getLogger(__name__)
+
+# Hue range (degrees), minimum saturation and minimum value that count as
+# board green in the HSV masking mode
+HSV_GREEN_HUE = (75, 165)
+HSV_MIN_SATURATION = 0.25
+HSV_MIN_VALUE = 0.15
+
+# NumPy clustering path: orientation histogram smoothing (1 degree bins), how
+# many orientation peaks to consider and how far apart (degrees) they must be,
+# the minimum angle between the two line families, how far (degrees) a segment
+# may be from its family (acos(0.95), as in the DBSCAN path), how far segments
+# are extended when checking that they cross, and the grid size for merging
+# intersections as a fraction of the image's longer side
+ANGLE_SMOOTHING_BINS = 2
+MAX_ANGLE_PEAKS = 4
+PEAK_SUPPRESSION_ANGLE = 15
+GRID_MIN_ANGLE = 30
+GRID_ANGLE_TOLERANCE = 18.2
+SEGMENT_CROSSING_MARGIN = 0.25
+GRID_SNAP_FRACTION = 1 / 50
+
+# The outermost merged intersections are often stray crossings of a frame
+# edge just outside the grid; each corner is moved to the mean of all the
+# intersections within this fraction of the image's longer side, which pulls
+# it back onto the grid the way the KMeans centers of the sklearn path do
+CORNER_REFINE_FRACTION = 1 / 30
+
+#Debug helper for the commented-out show_debug calls below: displays img and,
+#optionally, an (n, 2) array of points. matplotlib is only imported here so
+#workers never load it.
+def show_debug(img, points=None):
+    import matplotlib.pyplot as plt
+    plt.imshow(img)
+    if points is not None:
+        plt.scatter(points[:,0],points[:,1], color='yellow', s=5, marker='o')
+    plt.show()
+
+#Returns a boolean mask of the pixels whose summed absolute RGB difference from
+#chroma_key is below threshold
+def chroma_key_mask(img, chroma_key, threshold):
+    key = np.asarray(chroma_key)
+    if img.ndim == 2:
+        difference = np.abs(key - img[..., np.newaxis])
+    else:
+        difference = np.abs(key - img)
+    return np.sum(difference, axis=-1) < threshold
+
+#Returns a boolean mask of the green pixels of an RGB image (float 0-1),
+#segmented in HSV space so it is less sensitive to lighting than the RGB key
+def hsv_green_mask(img):
+    hsv = cv2.cvtColor(np.float32(img), cv2.COLOR_RGB2HSV)  # H in degrees, S and V in 0-1
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    return ((hue >= HSV_GREEN_HUE[0]) & (hue <= HSV_GREEN_HUE[1])
+            & (saturation >= HSV_MIN_SATURATION) & (value >= HSV_MIN_VALUE))
 
 #Applies Mask to the image
-def prep_image(img, chroma_key,sigma,ksize, threshold):
+#mode="rgb" keeps pixels close to chroma_key; mode="hsv" keeps green pixels by
+#hue and ignores chroma_key and threshold
+def prep_image(img, chroma_key,sigma,ksize, threshold, mode="rgb"):
     oned_fil = cv2.getGaussianKernel(ksize, sigma) # 1D kernel
     twod_fil = oned_fil*np.transpose(oned_fil)
 
-    im_fil_low = img.copy()#cv2.filter2D(img,-1,twod_fil)
-    
-    dim = 3 if len(im_fil_low.shape) == 3 else 1
+    if mode == "hsv":
+        mask = hsv_green_mask(img)
+    elif mode == "rgb":
+        mask = chroma_key_mask(img, chroma_key, threshold)
+    else:
+        raise ValueError(f"Unknown mask mode: {mode}")
+
+    # Every channel of a pixel is 1 if it matched and 0 otherwise
+    if img.ndim == 3:
+        mask = mask[..., np.newaxis]
+    im_fil_low = np.broadcast_to(mask, img.shape).astype(img.dtype)
 
-    for i in range (im_fil_low.shape[0]):
-        for j in range(im_fil_low.shape[1]):
-            color = img[i][j]
-            difference = np.abs(chroma_key-color)
-            im_fil_low[i][j] = np.ones(dim) if (np.sum(difference) < threshold) else np.zeros(dim)
-    
     im_fil_low = np.clip(cv2.filter2D(im_fil_low,-1,twod_fil),0,1)
-    # plt.imshow(im_fil_low)
-    # plt.show()
+    # show_debug(im_fil_low)
     
     return im_fil_low
 
 #Function that calculates Hough and its Helper functions are listed below
-from itertools import product
-def compute_line(line):
-    """Returns line coefficients (a, b, c) from points: ax + by + c = 0"""
-    a = line[1] - line[3]
-    b = line[2] - line[0]
-    c = line[0]*line[3] - line[2]*line[1]
-    return a, b, -c
-
-def intersection(L1, L2):
-    """Find intersection point of two lines given in ax + by + c = 0 form"""
-    D = L1[0] * L2[1] - L1[1] * L2[0]
-    if D == 0:
-        return None  # parallel lines
-    Dx = L1[2] * L2[1] - L1[1] * L2[2]
-    Dy = L1[0] * L2[2] - L1[2] * L2[0]
-    x = Dx / D
-    y = Dy / D
-    return x, y
-
-def hough(img):
-    print("Made call to Hough")
-    mask = prep_image(img,(0,1,0),10,(int)(img.shape[0]/10),0.95)
-    masked_img =  (mask*img * 255).astype(np.uint8)
-    # plt.imshow(masked_img)
-    # plt.show()
 
-    masked_gray =  cv2.cvtColor(masked_img, cv2.COLOR_RGB2GRAY)
-    masked_gray = cv2.GaussianBlur(masked_gray, (5, 5), 0)
-    edges = cv2.Canny(masked_gray,25,75)
-    lines = cv2.HoughLinesP(edges,rho=1,theta=np.pi / 180,threshold=img.shape[0]//10,minLineLength=img.shape[0]/4,maxLineGap=img.shape[0]//10)
-    # ✅ Early return if no lines found
-    if lines is None or len(lines) == 0:
-        print("⚠️ No lines detected by Hough Transform.")
-        return np.array([])  # return empty array
-    line_detection_img = img.copy()
-    # plt.imshow(edges)
-    # plt.show()
+#Line coefficients (a, b, c) of ax + by = c for an (n, 4) array of segments
+def compute_lines(lines):
+    lines = np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+    x1, y1, x2, y2 = lines[:,0], lines[:,1], lines[:,2], lines[:,3]
+    return y1 - y2, x2 - x1, x2*y1 - x1*y2
+
+#Intersections of every vertical line with every horizontal line, computed
+#for all pairs at once. Parallel pairs are dropped. Returns an (n, 2) array.
+def line_intersections(vertical, horizontal):
+    a1, b1, c1 = (v[:, np.newaxis] for v in compute_lines(vertical))
+    a2, b2, c2 = (h[np.newaxis, :] for h in compute_lines(horizontal))
+    D = a1*b2 - b1*a2
+    Dx = c1*b2 - b1*c2
+    Dy = a1*c2 - c1*a2
+    valid = D != 0
+    return np.stack([Dx[valid] / D[valid], Dy[valid] / D[valid]], axis=-1)
+
+#Points where a segment of a crosses a segment of b, allowing each segment to
+#be extended by SEGMENT_CROSSING_MARGIN of its length at both ends. Returns an
+#(n, 2) array.
+def crossing_points(a, b):
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((0, 2))
+    a = np.asarray(a, dtype=np.float64)[:, np.newaxis, :]
+    b = np.asarray(b, dtype=np.float64)[np.newaxis, :, :]
+    da = a[..., 2:] - a[..., :2]
+    db = b[..., 2:] - b[..., :2]
+    offset = b[..., :2] - a[..., :2]
+    cross = da[..., 0]*db[..., 1] - da[..., 1]*db[..., 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (offset[..., 0]*db[..., 1] - offset[..., 1]*db[..., 0]) / cross
+        u = (offset[..., 0]*da[..., 1] - offset[..., 1]*da[..., 0]) / cross
+    lo, hi = -SEGMENT_CROSSING_MARGIN, 1 + SEGMENT_CROSSING_MARGIN
+    crosses = (cross != 0) & (t >= lo) & (t <= hi) & (u >= lo) & (u <= hi)
+    return (a[..., :2] + t[..., np.newaxis]*da)[crosses]
+
+#Splits segments into the two line families of the board grid using the
+#orientation histogram. Every pair of histogram peaks at least GRID_MIN_ANGLE
+#apart is a candidate; each segment joins the closer peak if it is within
+#GRID_ANGLE_TOLERANCE. The board outline and grid lines meet each other over
+#the whole board, so the pair whose crossing points span the largest area wins.
+def split_lines_histogram(lines):
+    lines = np.asarray(lines).reshape(-1, 4)
+    dx = (lines[:,2] - lines[:,0]).astype(np.float64)
+    dy = (lines[:,3] - lines[:,1]).astype(np.float64)
+    angles = np.degrees(np.arctan2(dy, dx)) % 180
+    bins = np.floor(angles).astype(int) % 180
+    histogram = np.bincount(bins, minlength=180).astype(np.float64)
+
+    # Circular smoothing so a family split across neighbouring bins is one peak
+    window = np.arange(-ANGLE_SMOOTHING_BINS, ANGLE_SMOOTHING_BINS + 1)
+    smoothed = histogram[(np.arange(180)[:, np.newaxis] + window) % 180].sum(axis=1)
+
+    def angle_distance(a, b):
+        d = np.abs(a - b) % 180
+        return np.minimum(d, 180 - d)
+
+    # Strongest orientations, suppressing the neighbourhood of each one found
+    centers = np.arange(180) + 0.5
+    peaks = []
+    while len(peaks) < MAX_ANGLE_PEAKS and smoothed.max() > 0:
+        peak = np.argmax(smoothed)
+        peaks.append(centers[peak])
+        smoothed = np.where(angle_distance(centers, centers[peak]) < PEAK_SUPPRESSION_ANGLE, 0, smoothed)
+
+    best, best_area = (lines[:0], lines[:0]), 0
+    for first, second in combinations(peaks, 2):
+        if angle_distance(first, second) < GRID_MIN_ANGLE:
+            continue
+        to_first = angle_distance(angles, first)
+        to_second = angle_distance(angles, second)
+        in_first = (to_first <= to_second) & (to_first <= GRID_ANGLE_TOLERANCE)
+        in_second = (to_second < to_first) & (to_second <= GRID_ANGLE_TOLERANCE)
+        points = crossing_points(lines[in_second], lines[in_first])
+        if len(points) < 3:
+            continue
+        area = cv2.contourArea(cv2.convexHull(points.astype(np.float32)))
+        if area > best_area:
+            best, best_area = (lines[in_second], lines[in_first]), area
+    return best
+
+#Moves each corner to the mean of the points within radius of it
+def refine_corners(corners, points, radius):
+    refined = np.empty((len(corners), 2), dtype=np.float64)
+    for i, corner in enumerate(corners):
+        near = points[np.linalg.norm(points - corner, axis=1) <= radius]
+        refined[i] = near.mean(axis=0) if len(near) else corner
+    return refined
+
+#Merges intersections closer than about cell_size by snapping them to a grid
+#of that size and averaging the points that land in the same grid cell
+def dedupe_points_grid(points, cell_size):
+    if len(points) == 0:
+        return points
+    keys = np.floor(points / cell_size).astype(np.int64)
+    _, groups = np.unique(keys, axis=0, return_inverse=True)
+    groups = groups.reshape(-1)
+    counts = np.bincount(groups)
+    merged = np.zeros((len(counts), 2))
+    np.add.at(merged, groups, points)
+    return merged / counts[:, np.newaxis]
+
+#Original line grouping: DBSCAN on the segment angles, then segments outside
+#the first two clusters join whichever family they are nearly parallel to
+def split_lines_dbscan(lines):
+    from sklearn.cluster import DBSCAN as db
 
     thetas = []
-    for x1,y1,x2,y2 in lines[:,0]:
+    for x1,y1,x2,y2 in lines:
         theta = np.arctan2(y2-y1, x2-x1) + 3*np.pi/2
         thetas.append([theta])
     thetas = np.array(thetas)
@@ -83,15 +209,13 @@ def hough(img):
     vert_dir = np.zeros(2,dtype=np.float64)
     horz_dir = np.zeros(2)
     for i in range(len(lines)):
-        x1,y1,x2,y2 = lines[i][0]
+        x1,y1,x2,y2 = lines[i]
         if labels[i] == 1:
-            vertical.append(lines[i][0])
+            vertical.append(lines[i])
             vert_dir += [x2 - x1, y2 - y1]
-            color = [1,0,0]
         elif labels[i] == 0:
-            horizontal.append(lines[i][0])
+            horizontal.append(lines[i])
             horz_dir += [x2 - x1, y2 - y1]
-            color = [0,0,1]
         else:
             v1 = np.array([x2 - x1, y2 - y1],dtype=np.float64)
             v1 /= np.linalg.norm(v1)
@@ -99,37 +223,64 @@ def hough(img):
             normalized_vert_dir = vert_dir/np.linalg.norm(vert_dir)
 
             if abs(np.dot(v1, normalized_vert_dir)) > 0.95:
-                vertical.append(lines[i][0])
+                vertical.append(lines[i])
                 vert_dir += [x2 - x1, y2 - y1]
-                color = [1,0,0]
             elif abs(np.dot(v1, normalized_horz_dir)) > 0.95:
-                horizontal.append(lines[i][0])
+                horizontal.append(lines[i])
                 horz_dir += [x2 - x1, y2 - y1]
-                color = [0,0,1]
-            else:
-                color = [0,1,0]
-        cv2.line(line_detection_img, (x1, y1), (x2, y2), color, 3)
-    
-    points = []
-    for a, b in product(vertical, horizontal):
-        L1 = compute_line(a)
-        L2 = compute_line(b)
-        pt = intersection(L1, L2)
-        if pt:
-            points.append(pt)
-            #plt.scatter(pt[0], pt[1], color='pink', s=5, marker='o')
-    points = np.array(points)
-    # plt.imshow(line_detection_img)
-    # plt.show()
-
-    if points.size > 81:
+    return vertical, horizontal
+
+#Original point reduction: KMeans down to the 81 grid intersections of the board
+def cluster_points_kmeans(points):
+    from sklearn.cluster import KMeans
+
+    if len(points) > 81:
         kmeans = KMeans(n_clusters=81, n_init='auto')
-        labels = kmeans.fit_predict(points)
+        kmeans.fit(points)
         points = kmeans.cluster_centers_
-    # plt.imshow(img)
-    # plt.scatter(points[:,0],points[:,1], color='yellow', s=5, marker='o')
-    # plt.show()
+    return points
 
+#Board mask of img (float RGB, 0-1) as computed for corner detection, with
+#the kernel size scaled to the image height
+def board_mask(img, mask_mode="rgb"):
+    return prep_image(img,(0,1,0),10,(int)(img.shape[0]/10),0.95,mask_mode)
+
+#Line segments (n, 4) found by the probabilistic Hough transform on the edges
+#of the masked image, or an empty array if there are none
+def detect_lines(img, mask):
+    masked_img =  (mask*img * 255).astype(np.uint8)
+    # show_debug(masked_img)
+
+    masked_gray =  cv2.cvtColor(masked_img, cv2.COLOR_RGB2GRAY)
+    masked_gray = cv2.GaussianBlur(masked_gray, (5, 5), 0)
+    edges = cv2.Canny(masked_gray,25,75)
+    lines = cv2.HoughLinesP(edges,rho=1,theta=np.pi / 180,threshold=img.shape[0]//10,minLineLength=img.shape[0]/4,maxLineGap=img.shape[0]//10)
+    # show_debug(edges)
+    if lines is None or len(lines) == 0:
+        return np.empty((0, 4), dtype=np.int32)
+    return lines[:,0]
+
+#Groups the segments of an image of the given shape into the two line
+#families, intersects them and returns the four outer corners of the
+#intersection grid, or an empty array if they cannot be found
+def corners_from_lines(lines, shape, clustering="numpy"):
+    if clustering == "sklearn":
+        vertical, horizontal = split_lines_dbscan(lines)
+    elif clustering == "numpy":
+        vertical, horizontal = split_lines_histogram(lines)
+    else:
+        raise ValueError(f"Unknown clustering: {clustering}")
+
+    intersections = line_intersections(vertical, horizontal)
+    if clustering == "sklearn":
+        points = cluster_points_kmeans(intersections)
+    else:
+        points = dedupe_points_grid(intersections, max(shape[:2]) * GRID_SNAP_FRACTION)
+    # show_debug(img, points)
+
+    if len(points) < 4:
+        logger.warning("Too few line intersections to find the board")
+        return np.array([])
 
     corners = np.zeros((4,2))
     hull = cv2.convexHull(points.astype(np.float32))
@@ -137,5 +288,51 @@ def hough(img):
     approx = cv2.approxPolyDP(hull, epsilon, True)
     if len(approx) == 4:
         corners = approx[:, 0, :]  # shape (4, 2)
-    
-    return corners
\ No newline at end of file
+        if clustering == "numpy":
+            corners = refine_corners(corners, intersections, max(shape[:2]) * CORNER_REFINE_FRACTION)
+
+    return corners
+
+#Finds the four outer corners of the board: board_mask, then detect_lines,
+#then corners_from_lines. clustering="numpy" groups lines with an angle
+#histogram and merges intersections by snapping them to a grid;
+#clustering="sklearn" uses the original DBSCAN + KMeans(81) path
+def hough(img, mask_mode="rgb", clustering="numpy"):
+    with span("mask", mode=mask_mode):
+        mask = board_mask(img, mask_mode)
+    with span("hough") as attributes:
+        lines = detect_lines(img, mask)
+        attributes["lines"] = len(lines)
+    # ✅ Early return if no lines found
+    if len(lines) == 0:
+        logger.warning("No lines detected by Hough Transform")
+        return np.array([])  # return empty array
+    with span("clustering", method=clustering):
+        return corners_from_lines(lines, img.shape, clustering)
+
+#Copy of img shrunk so its longer side is at most max_side pixels, and the
+#(x, y) factors that map its pixel coordinates back to img. max_side=None
+#(or an image already small enough) returns img itself.
+def downscale(img, max_side=800):
+    scale = 1.0 if not max_side else max_side / max(img.shape[:2])
+    if scale >= 1.0:
+        return img, np.ones(2, dtype=np.float32)
+
+    proxy_size = (max(1, round(img.shape[1]*scale)), max(1, round(img.shape[0]*scale)))
+    proxy = cv2.resize(img, proxy_size, interpolation=cv2.INTER_AREA)
+    scale_xy = np.array([img.shape[1] / proxy_size[0], img.shape[0] / proxy_size[1]], dtype=np.float32)
+    return proxy, scale_xy
+
+#Runs hough on a copy of img shrunk so its longer side is at most max_side
+#pixels and scales the detected corners back to img's resolution. The Hough
+#thresholds already scale with the image size, so large photos gain nothing
+#from being processed at full resolution. max_side=None uses the full image.
+def hough_downscaled(img, max_side=800, mask_mode="rgb", clustering="numpy"):
+    with span("downscale"):
+        proxy, scale_xy = downscale(img, max_side)
+    corners = hough(proxy, mask_mode, clustering)
+    if proxy is img or corners.size == 0:
+        return corners
+
+    # Map proxy pixel coordinates back to the full resolution image
+    return (corners * scale_xy).astype(np.float32)
@@ -0,0 +1,144 @@
+import json
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import storage_utils
+from utils.pipeline_utils import json_response
+
+logger = logging.getLogger(__name__)
+
+# Asynchronous analyses behind /jobs. A job's state lives in the jobs table of
+# the submissions database, so any server process can report on it and a job
+# interrupted by a restart is run again. The pipeline records the detected
+# board and every completed search iteration on the job as it goes.
+
+# Job columns holding JSON
+JSON_FIELDS = ("board", "white", "black", "result")
+
+# How often an event stream looks for changes, and how long it stays silent
+# before sending a comment so proxies keep the connection open
+POLL_INTERVAL = 0.25
+KEEPALIVE_INTERVAL = 15
+
+
+def decode_job(job):
+    """Returns the job dict from storage_utils.get_job with its JSON columns decoded."""
+    job = dict(job)
+    for field in JSON_FIELDS:
+        if job[field] is not None:
+            job[field] = json.loads(job[field])
+    return job
+
+
+def format_event(name, data, version):
+    """One server-sent event; `data` is a JSON string."""
+    return f"id: {version}\nevent: {name}\ndata: {data}\n\n"
+
+
+class JobRunner:
+    """
+    Runs uploads through a pipeline_utils.Pipeline on `workers` background
+    threads. submit() stores the upload and returns a job id at once;
+    clients then read the job with get() or follow it with events().
+
+    resume() re-runs jobs that are still queued, and jobs whose worker
+    stopped updating them `stale_after` seconds ago, e.g. after a restart.
+    """
+
+    def __init__(self, pipeline, workers=1, stale_after=120.0):
+        self.pipeline = pipeline
+        self.db_path = pipeline.config["DB_PATH"]
+        self.blob_dir = pipeline.config["BLOB_DIR"]
+        self.stale_after = stale_after
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def submit(self, upload, original_filename, time_budget=None):
+        """Queues the analysis of the uploaded bytes and returns the job id."""
+        job_id = str(uuid.uuid4())
+        digest = storage_utils.put_blob(upload, self.blob_dir)
+        storage_utils.create_job(job_id, original_filename, digest,
+                                 self.pipeline.time_budget(time_budget), self.db_path)
+        self.executor.submit(self._run, job_id)
+        return job_id
+
+    def resume(self):
+        """Queues unfinished jobs left by earlier runs and returns how many there were."""
+        job_ids = storage_utils.requeue_stale_jobs(self.stale_after, self.db_path)
+        for job_id in job_ids:
+            self.executor.submit(self._run, job_id)
+        return len(job_ids)
+
+    def _run(self, job_id):
+        # Another worker may have claimed it already
+        if not storage_utils.claim_job(job_id, self.db_path):
+            return
+        job = storage_utils.get_job(job_id, self.db_path)
+        upload = storage_utils.get_blob(job["upload_hash"], self.blob_dir)
+        if upload is None:
+            storage_utils.update_job(job_id, path=self.db_path, status="failed", error="upload_missing")
+            return
+
+        try:
+            response, status = self.pipeline.predict(upload, job["filename"], job["time_budget"],
+                                                     job_id=job_id)
+        except Exception as e:
+            logger.exception("Job %s failed: %s", job_id, e)
+            response, status = {"error": "internal_error"}, 500
+
+        if status == 200:
+            storage_utils.update_job(job_id, path=self.db_path, status="done",
+                                     result=json.dumps(json_response(response)))
+        else:
+            storage_utils.update_job(job_id, path=self.db_path, status="failed", error=response["error"])
+        logger.info("Job %s %s", job_id, "done" if status == 200 else "failed")
+
+    def get(self, job_id):
+        """Returns the decoded job, or None if there is none."""
+        job = storage_utils.get_job(job_id, self.db_path)
+        return decode_job(job) if job is not None else None
+
+    def events(self, job_id, last_version=0):
+        """
+        Yields server-sent events for the job until it finishes: status when
+        it changes, board once the pieces are detected, white and black after
+        every completed search iteration, then done with the full /predict
+        response or failed with the error. Each event's id is the job
+        version, so a client reconnecting with Last-Event-ID `last_version`
+        only gets events for later changes.
+        """
+        sent = {}
+        quiet_since = time.monotonic()
+        while True:
+            job = storage_utils.get_job(job_id, self.db_path)
+            if job is None:
+                yield format_event("failed", json.dumps({"error": "job_not_found"}), 0)
+                return
+
+            version = job["version"]
+            finished = job["status"] in ("done", "failed")
+            if version > last_version:
+                last_version = version
+                quiet_since = time.monotonic()
+                if job["status"] != sent.get("status"):
+                    sent["status"] = job["status"]
+                    yield format_event("status", json.dumps({"status": job["status"]}), version)
+                for field in ("board", "white", "black"):
+                    if job[field] is not None and job[field] != sent.get(field):
+                        sent[field] = job[field]
+                        yield format_event(field, job[field], version)
+                if job["status"] == "done":
+                    yield format_event("done", job["result"], version)
+                elif job["status"] == "failed":
+                    yield format_event("failed", json.dumps({"error": job["error"]}), version)
+            elif time.monotonic() - quiet_since >= KEEPALIVE_INTERVAL:
+                quiet_since = time.monotonic()
+                yield ": keepalive\n\n"
+
+            if finished:
+                return
+            time.sleep(POLL_INTERVAL)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
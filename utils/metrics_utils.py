@@ -0,0 +1,198 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Metrics of this server process in the Prometheus text format (served at
+# /metrics), and tracing spans around the pipeline stages. A span records how
+# long a stage took; the spans of a request are collected with trace() so they
+# can be returned to the client, and go into the stage latency histogram once
+# the request is done. Work run on the worker pool is wrapped in call_traced,
+# so the spans recorded in the worker process come back with its result.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEPTH_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 12, 16, 20, 30, 60)
+
+LOG_FORMAT = "%(asctime)s %(processName)s %(name)s %(levelname)s %(message)s"
+
+
+def configure_logging(level="INFO"):
+    """Sends this process's log records of `level` and up to stderr."""
+    logging.basicConfig(level=level.upper(), format=LOG_FORMAT)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    """A count per combination of label values that only goes up."""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Observations counted into `buckets` (upper bounds) per combination of label values."""
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [bucket counts, sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            entry = self.values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                # Buckets are cumulative in the exposition format
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    """The metrics of this process, rendered together for /metrics."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, description, labels=()):
+        metric = Counter(name, description, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, description, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+REQUESTS = REGISTRY.counter(
+    "othello_http_requests_total", "HTTP requests by route and status code.", ("route", "status"))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "othello_http_request_duration_seconds", "Time to produce an HTTP response by route.", ("route",))
+STAGE_SECONDS = REGISTRY.histogram(
+    "othello_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",))
+SEARCH_NODES = REGISTRY.counter(
+    "othello_search_nodes_total", "Positions visited by the searches.", ("side",))
+SEARCH_CUTOFFS = REGISTRY.counter(
+    "othello_search_cutoffs_total", "Beta cutoffs in the searches.", ("side",))
+SEARCH_DEPTH = REGISTRY.histogram(
+    "othello_search_depth", "Depth reached by each completed search.", ("side",), DEPTH_BUCKETS)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "othello_cache_lookups_total",
+    "Lookups of the result cache (memory, store or miss), the analysis cache and the opening book (hit or miss).",
+    ("cache", "result"))
+TT_PROBES = REGISTRY.counter(
+    "othello_transposition_table_probes_total", "Transposition table probes by the searches.", ("result",))
+
+
+# Spans of the request being handled in this thread, or None outside trace()
+_spans = contextvars.ContextVar("othello_spans", default=None)
+
+
+def record_spans(spans):
+    """Adds spans to the histogram of stage latencies and logs them."""
+    for entry in spans:
+        STAGE_SECONDS.observe(entry["ms"] / 1000, stage=entry["stage"])
+        logger.debug("%s took %.1f ms %s", entry["stage"], entry["ms"],
+                     {key: value for key, value in entry.items() if key not in ("stage", "ms")})
+
+
+def add_spans(spans):
+    """Adds finished spans to the current trace, or records them if there is none."""
+    current = _spans.get()
+    if current is not None:
+        current.extend(spans)
+    else:
+        record_spans(spans)
+
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Times the block as pipeline stage `stage`. The yielded dict holds the
+    span's attributes; the block may add to it (e.g. the depth a search
+    reached) and they are reported with the timing.
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        add_spans([{"stage": stage, "ms": round((time.perf_counter() - start) * 1000, 3), **attributes}])
+
+
+@contextmanager
+def trace():
+    """Collects the spans finished in the block into the yielded list instead of recording them."""
+    spans = []
+    token = _spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _spans.reset(token)
+
+
+def call_traced(fn, *args):
+    """Worker pool job wrapper: returns (fn(*args), the spans it finished)."""
+    with trace() as spans:
+        result = fn(*args)
+    return result, spans
+
+
+def record_search(side, result):
+    """Counts a search result's nodes, cutoffs, depth and cache or book use."""
+    if result.get("cached"):
+        CACHE_LOOKUPS.inc(cache="analysis", result="hit")
+        return
+    CACHE_LOOKUPS.inc(cache="analysis", result="miss")
+    CACHE_LOOKUPS.inc(cache="book", result="hit" if result.get("book") else "miss")
+    SEARCH_NODES.inc(result["nodes"], side=side)
+    SEARCH_CUTOFFS.inc(result["cutoffs"], side=side)
+    SEARCH_DEPTH.observe(result["depth"], side=side)
+    TT_PROBES.inc(result.get("tt_hits", 0), result="hit")
+    TT_PROBES.inc(result.get("tt_misses", 0), result="miss")
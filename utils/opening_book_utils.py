@@ -0,0 +1,166 @@
+import os
+from collections import deque
+
+import numpy as np
+
+from utils import bitboard_utils as bb
+from utils import optimal_positions_utils
+from utils.analysis_cache_utils import canonicalize
+from utils.transposition_utils import TranspositionTable, zobrist_hash
+
+# On-disk opening book: an 8 byte magic followed by fixed-size records sorted
+# by key, so the file can be memory-mapped and searched with a binary search
+# without being loaded. The key is the Zobrist hash of the position in
+# canonical orientation (see analysis_cache_utils.canonicalize) with the side
+# to move; the move is a square in that orientation.
+MAGIC = b"OTHBOOK1"
+RECORD = np.dtype([("key", "<u8"), ("move", "u1"), ("depth", "u1"), ("score", "<i2")])
+NO_MOVE = 255
+
+BOOK_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'opening_book.bin'))
+
+
+def book_key(white, black, player):
+    """Returns (key, permutation) of the position for book lookups."""
+    canonical_white, canonical_black, permutation = canonicalize(white, black)
+    return zobrist_hash(canonical_white, canonical_black, player), permutation
+
+
+class OpeningBook:
+    """
+    Read-only opening book backed by a memory-mapped file written by
+    build_book. Lookups are a binary search over the sorted keys.
+    """
+
+    def __init__(self, path=BOOK_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an opening book")
+        if os.path.getsize(path) == len(MAGIC):
+            self.records = np.zeros(0, dtype=RECORD)
+        else:
+            self.records = np.memmap(path, dtype=RECORD, mode="r", offset=len(MAGIC))
+        self.keys = self.records["key"]
+
+    def __len__(self):
+        return len(self.records)
+
+    def lookup(self, board, player):
+        """
+        Returns an iterative_deepening style result dict (with book: True)
+        for `player` to move on `board`, or None if the position is not in
+        the book.
+        """
+        white, black = bb.from_board(board)
+        key, permutation = book_key(white, black, player)
+        index = int(np.searchsorted(self.keys, np.uint64(key)))
+        if index == len(self.keys) or int(self.keys[index]) != key:
+            return None
+
+        record = self.records[index]
+        best_move = None
+        if record["move"] != NO_MOVE:
+            best_move = bb.square_to_move(permutation[int(record["move"])])
+        return {"best_move": best_move, "score": int(record["score"]), "depth": int(record["depth"]),
+                "exact": False, "nodes": 0, "cutoffs": 0, "elapsed": 0.0, "book": True}
+
+
+def load_book(path=BOOK_PATH):
+    """Returns the OpeningBook at `path`, or None if there is no book file."""
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+def starting_position():
+    board = np.zeros((8, 8))
+    board[3][3] = board[4][4] = 1
+    board[3][4] = board[4][3] = -1
+    return bb.from_board(board)
+
+
+def score_moves(own, opp, player, depth, tt, width=None):
+    """
+    Returns [(score, square)] for every move of the side to move, best first,
+    each searched `depth` plies deep after shallower passes that order the
+    moves. Scores are from the mover's point of view. With `width`, only the
+    `width` best scores are exact; every other move is only shown not to beat
+    them with a null window and carries the width-th best score as its bound.
+    """
+    order = list(bb.iter_squares(bb.get_moves(own, opp)))
+    ctx = optimal_positions_utils.SearchContext(tt)
+    scored = []
+    for pass_depth in range(1, depth + 1):
+        scored = []
+        for sq in order:
+            new_own, new_opp = bb.make_move(own, opp, sq)
+            white, black = bb.join_by_player(new_own, new_opp, player)
+            h = zobrist_hash(white, black, -player)
+
+            def search(alpha, beta):
+                score, _ = optimal_positions_utils.negamax(
+                    new_opp, new_own, -player, pass_depth - 1, -beta, -alpha, ctx, h, 1
+                )
+                return -score
+
+            if width is None or len(scored) < width:
+                score = search(float('-inf'), float('inf'))
+            else:
+                bound = scored[width - 1][0]
+                score = search(bound, bound + 1)
+                score = search(bound, float('inf')) if score > bound else bound
+            scored.append((score, sq))
+            scored.sort(key=lambda item: -item[0])
+        order = [sq for _, sq in scored]
+    return scored
+
+
+def build_book(path, plies=10, depth=6, width=2, progress=None):
+    """
+    Writes an opening book of every position reached from the start within
+    `plies` moves when each side plays one of its `width` best moves, each
+    analysed with a `depth` ply search. Black moves first. Returns the
+    number of positions written.
+    """
+    tt = TranspositionTable(1 << 20)
+    records = {}
+    white, black = starting_position()
+    queue = deque([(white, black, -1, 0)])
+
+    while queue:
+        white, black, player, ply = queue.popleft()
+        key, permutation = book_key(white, black, player)
+        if key in records:
+            continue
+
+        own, opp = bb.split_by_player(white, black, player)
+        if not bb.get_moves(own, opp):
+            if bb.get_moves(opp, own) and ply < plies:
+                queue.append((white, black, -player, ply))  # pass
+            continue
+
+        tt.new_search()
+        scored = score_moves(own, opp, player, depth, tt, width)
+        best_score, best_sq = scored[0]
+        records[key] = (permutation.index(best_sq), depth, best_score * player)
+        if progress is not None:
+            progress(len(records), ply)
+
+        if ply + 1 < plies:
+            for _, sq in scored[:width]:
+                new_own, new_opp = bb.make_move(own, opp, sq)
+                new_white, new_black = bb.join_by_player(new_own, new_opp, player)
+                queue.append((new_white, new_black, -player, ply + 1))
+
+    table = np.zeros(len(records), dtype=RECORD)
+    for i, (key, (move, record_depth, score)) in enumerate(sorted(records.items())):
+        table[i] = (key, move, record_depth, score)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(table.tobytes())
+    os.replace(tmp_path, path)
+    return len(records)
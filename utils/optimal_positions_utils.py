@@ -1,74 +1,45 @@
+import time
 import numpy as np
-# 8 possible directions: vertical, horizontal, diagonal
-DIRECTIONS = [
-    (-1, -1), (-1, 0), (-1, 1),
-    (0, -1),          (0, 1),
-    (1, -1),  (1, 0), (1, 1)
-]
+from utils import bitboard_utils as bb
+from utils import endgame_utils
+from utils.endgame_utils import ENDGAME_EMPTIES
+from utils.transposition_utils import (
+    EXACT, LOWER, UPPER, TranspositionTable, zobrist_hash, update_hash, pass_hash
+)
 
-def is_on_board(x, y):
-    return 0 <= x < 8 and 0 <= y < 8
+# The search runs on bitboards (see bitboard_utils). The functions below keep
+# the 8x8 board_state array interface used by backend/app.py and convert at
+# the boundary, so a whole minimax call only converts the board once.
 
-def get_valid_moves(board, player):
-    opponent = -player
-    valid_moves = set()
-
-    for row in range(8):
-        for col in range(8):
-            if board[row][col] != 0:
-                continue  # already occupied
-
-            for dx, dy in DIRECTIONS:
-                x, y = row + dx, col + dy
-                found_opponent = False
 
-                # Step in the current direction
-                while is_on_board(x, y) and board[x][y] == opponent:
-                    x += dx
-                    y += dy
-                    found_opponent = True
-
-                # Check if there's a sandwich: opponent(s) followed by your piece
-                if found_opponent and is_on_board(x, y) and board[x][y] == player:
-                    valid_moves.add((row, col))
-                    break  # no need to check other directions
+def get_valid_moves(board, player):
+    """
+    Returns every legal move for `player` as a list of (row, col) tuples.
 
-    return list(valid_moves)
+    Parameters:
+        board (np.ndarray): Current board state (8x8)
+        player (int): -1 for black, 1 for white
+    """
+    white, black = bb.from_board(board)
+    own, opp = bb.split_by_player(white, black, player)
+    return [bb.square_to_move(sq) for sq in bb.iter_squares(bb.get_moves(own, opp))]
 
 def make_move(board, move, player):
     """
     Places a move on the board and flips opponent pieces.
-    
+
     Parameters:
         board (np.ndarray): Current board state (8x8)
         move (tuple): (row, col) where player wants to move
         player (int): -1 for black, 1 for white
-        
+
     Returns:
         np.ndarray: New board state after move
     """
-    directions = [(-1, -1), (-1, 0), (-1, 1),
-                  (0, -1),          (0, 1),
-                  (1, -1),  (1, 0),  (1, 1)]
-    
-    board = board.copy()
-    row, col = move
-    board[row, col] = player  # Place the piece
-
-    for dr, dc in directions:
-        r, c = row + dr, col + dc
-        discs_to_flip = []
-
-        while 0 <= r < 8 and 0 <= c < 8 and board[r, c] == -player:
-            discs_to_flip.append((r, c))
-            r += dr
-            c += dc
-
-        if 0 <= r < 8 and 0 <= c < 8 and board[r, c] == player:
-            for fr, fc in discs_to_flip:
-                board[fr, fc] = player
-
-    return board
+    white, black = bb.from_board(board)
+    own, opp = bb.split_by_player(white, black, player)
+    own, opp = bb.make_move(own, opp, bb.square(*move))
+    return bb.to_board(*bb.join_by_player(own, opp, player))
 
 def evaluate_board(board):
     """
@@ -84,69 +55,312 @@ def evaluate_board(board):
     eval_score = white_score - black_score
     return eval_score, white_score, black_score
 
+def evaluate_bitboards(white, black):
+    """Bitboard equivalent of evaluate_board."""
+    white_score = bb.popcount(white)
+    black_score = bb.popcount(black)
+    return white_score - black_score, white_score, black_score
+
+
+
+# Move ordering. Corners are tried first; X squares (diagonally next to a
+# corner) and C squares (orthogonally next to one) are tried last while that
+# corner is still empty, since they usually hand the corner to the opponent.
+CORNER, NORMAL, C_SQUARE, X_SQUARE = 0, 2, 3, 4
+KILLER = 1
+SQUARE_CLASS = [NORMAL] * 64
+ADJACENT_CORNER = [0] * 64
+for _corner, _x, _cs in (
+    (0, 9, (1, 8)), (7, 14, (6, 15)), (56, 49, (48, 57)), (63, 54, (55, 62))
+):
+    SQUARE_CLASS[_corner] = CORNER
+    SQUARE_CLASS[_x] = X_SQUARE
+    ADJACENT_CORNER[_x] = 1 << _corner
+    for _c in _cs:
+        SQUARE_CLASS[_c] = C_SQUARE
+        ADJACENT_CORNER[_c] = 1 << _corner
+
+MAX_PLY = 128  # 60 moves plus passes
+
+# Depth of the heuristic iterations run before the exact endgame solver, to
+# seed the transposition table with move ordering and have a fallback move
+ENDGAME_PRESEARCH_DEPTH = 4
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the context's deadline has passed."""
+
+
+class SearchContext:
+    """
+    State shared by every node of one search: the optional transposition
+    table, a node counter, an optional wall-clock deadline
+    (time.perf_counter() value) after which the search aborts, and the
+    killer/history tables used for move ordering.
+
+    With ordering=False moves are searched in square order with plain
+    alpha-beta, which is only useful to measure what ordering gains.
+    """
+
+    # Only look at the clock every this many nodes, it is not free
+    TIME_CHECK_INTERVAL = 1024
+
+    def __init__(self, tt=None, deadline=None, ordering=True):
+        self.tt = tt
+        self.deadline = deadline
+        self.ordering = ordering
+        self.nodes = 0
+        self.cutoffs = 0
+        # Two killer moves per ply: quiet moves that recently caused a cutoff
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        # History heuristic: cutoff counts per square, weighted by depth
+        self.history = {1: [0] * 64, -1: [0] * 64}
+
+    def visit(self):
+        self.nodes += 1
+        if (self.deadline is not None and self.nodes % self.TIME_CHECK_INTERVAL == 0
+                and time.perf_counter() >= self.deadline):
+            raise SearchTimeout()
+
+    def record_cutoff(self, sq, ply, depth, player):
+        self.cutoffs += 1
+        self.history[player][sq] += depth * depth
+        killers = self.killers[ply]
+        if killers[0] != sq:
+            killers[1] = killers[0]
+            killers[0] = sq
+
 
+def order_moves(moves, occupied, ctx, ply, player, hash_move=None):
+    """
+    Returns the squares in `moves` in the order they should be searched:
+    the hash / previous principal-variation move, corners, killer moves,
+    ordinary squares, then C and X squares next to an empty corner. Ties are
+    broken by the history heuristic.
+    """
+    squares = list(bb.iter_squares(moves))
+    if not ctx.ordering:
+        return squares
+
+    killers = ctx.killers[ply]
+    history = ctx.history[player]
+
+    def priority(sq):
+        if sq == hash_move:
+            return (-1, 0)
+        square_class = SQUARE_CLASS[sq]
+        if square_class > NORMAL and occupied & ADJACENT_CORNER[sq]:
+            square_class = NORMAL  # corner already taken, nothing to give away
+        if square_class != CORNER and sq in killers:
+            square_class = KILLER
+        return (square_class, -history[sq])
+
+    squares.sort(key=priority)
+    return squares
 
-def minimax(board, depth, alpha, beta, maximizing_player, player):
+
+def negamax(own, opp, player, depth, alpha, beta, ctx, h=0, ply=0):
     """
-    Minimax algorithm with alpha-beta pruning.
+    Principal-variation search in negamax form.
+
+    Scores are from the point of view of the side to move (`own` discs,
+    colour `player`), so a single branch serves both colours. The first move
+    is searched with the full window and the rest with a null window, which
+    is only widened again if a move turns out to be better. A side without
+    moves passes; the game ends when neither side can move.
+
+    `h` is the Zobrist hash of the position (only used with a transposition
+    table) and `ply` the distance from the root, used for killer moves.
+
+    Returns (score, best_move) where best_move is a square index or None.
+    """
+    ctx.visit()
+
+    if depth == 0:
+        return bb.popcount(own) - bb.popcount(opp), None
+
+    moves = bb.get_moves(own, opp)
+    if not moves:
+        if not bb.get_moves(opp, own):
+            return bb.popcount(own) - bb.popcount(opp), None  # game over
+        score, _ = negamax(opp, own, -player, depth, -beta, -alpha, ctx, pass_hash(h), ply + 1)
+        return -score, None
+
+    tt = ctx.tt
+    hash_move = None
+    if tt is not None:
+        entry = tt.probe(h)
+        if entry is not None:
+            _, entry_depth, flag, score, hash_move, _, _ = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return score, hash_move
+                if flag == LOWER:
+                    alpha = max(alpha, score)
+                elif flag == UPPER:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score, hash_move
+    alpha_orig = alpha
+
+    best_score = float('-inf')
+    best_move = None
+    pvs = ctx.ordering
+    for sq in order_moves(moves, own | opp, ctx, ply, player, hash_move):
+        flips = bb.get_flips(own, opp, sq)
+        new_own, new_opp = own | flips | (1 << sq), opp ^ flips
+        child_h = update_hash(h, player, sq, flips) if tt is not None else 0
+
+        if best_move is None or not pvs:
+            score = -negamax(new_opp, new_own, -player, depth - 1, -beta, -alpha, ctx, child_h, ply + 1)[0]
+        else:
+            score = -negamax(new_opp, new_own, -player, depth - 1, -alpha - 1, -alpha, ctx, child_h, ply + 1)[0]
+            if alpha < score < beta:
+                score = -negamax(new_opp, new_own, -player, depth - 1, -beta, -alpha, ctx, child_h, ply + 1)[0]
+
+        if score > best_score:
+            best_score, best_move = score, sq
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    ctx.record_cutoff(sq, ply, depth, player)
+                    break
+
+    if tt is not None:
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        tt.store(h, depth, flag, best_score, best_move)
+
+    return best_score, best_move
+
+
+def minimax(board, depth, alpha, beta, maximizing_player, player, tt=None):
+    """
+    Alpha-beta search from `board` with `player` to move.
+
+    The search itself is negamax (see negamax); this wrapper keeps the
+    original interface. Scores and the alpha/beta window are white - black.
+    `maximizing_player` is no longer needed, since the side to move always
+    picks its own best move, and is ignored. Pass a
+    transposition_utils.TranspositionTable as `tt` to reuse results for
+    positions reached through different move orders; the same table can be
+    shared by the white and black searches.
 
     Returns:
     - eval_score: Score difference for evaluation purposes
     - best_move: Move (row, col) with the best score
-    - white_score: Final white piece count after best move
-    - black_score: Final black piece count after best move
+    - white_score: White piece count after the best move
+    - black_score: Black piece count after the best move
     """
-    valid_moves = get_valid_moves(board, player)
+    white, black = bb.from_board(board)
+    own, opp = bb.split_by_player(white, black, player)
+    h = zobrist_hash(white, black, player) if tt is not None else 0
+    if player == 1:
+        window = (alpha, beta)
+    else:
+        window = (-beta, -alpha)
+    score, best_sq = negamax(own, opp, player, depth, window[0], window[1], SearchContext(tt), h)
 
-    # Base case: evaluate static board when depth exhausted or no moves
-    if depth == 0 or not valid_moves:
-        eval_score, white_score, black_score = evaluate_board(board)
-        return eval_score, None, white_score, black_score
+    best_move = None
+    if best_sq is not None:
+        best_move = bb.square_to_move(best_sq)
+        own, opp = bb.make_move(own, opp, best_sq)
+    white, black = bb.join_by_player(own, opp, player)
+    return score * player, best_move, bb.popcount(white), bb.popcount(black)
 
-    if maximizing_player:
-        max_eval = float('-inf')
-        best_move = None
-        best_white = 0
-        best_black = 0
 
-        for move in valid_moves:
-            new_board = make_move(board.copy(), move, player)
-            eval_score, _, w_score, b_score = minimax(
-                new_board, depth - 1, alpha, beta, False, -player
-            )
+def report_iteration(result, ctx, start, on_iteration, nodes=0, cutoffs=0):
+    """Calls on_iteration (if any) with a copy of result and the statistics so far."""
+    if on_iteration is not None:
+        on_iteration({**result, "nodes": ctx.nodes + nodes, "cutoffs": ctx.cutoffs + cutoffs,
+                      "elapsed": time.perf_counter() - start})
 
-            if eval_score > max_eval:
-                max_eval = eval_score
-                best_move = move
-                best_white = w_score
-                best_black = b_score
 
-            alpha = max(alpha, eval_score)
-            if beta <= alpha:
-                break  # Beta pruning
+def iterative_deepening(board, player, time_budget, max_depth=None, tt=None,
+                        endgame_empties=ENDGAME_EMPTIES, book=None, on_iteration=None):
+    """
+    Searches depth 1, 2, 3, ... for `player` until `time_budget` seconds have
+    passed and returns the best move of the deepest completed iteration.
 
-        return max_eval, best_move, best_white, best_black
+    Depth 1 always completes so there is a move to return. Each iteration
+    stores its result in the transposition table (a fresh one is used if none
+    is given), so the next iteration tries the previous principal variation
+    first, and killer/history statistics carry over between iterations.
 
-    else:
-        min_eval = float('inf')
-        best_move = None
-        best_white = 0
-        best_black = 0
-
-        for move in valid_moves:
-            new_board = make_move(board.copy(), move, player)
-            eval_score, _, w_score, b_score = minimax(
-                new_board, depth - 1, alpha, beta, True, -player
-            )
-
-            if eval_score < min_eval:
-                min_eval = eval_score
-                best_move = move
-                best_white = w_score
-                best_black = b_score
-
-            beta = min(beta, eval_score)
-            if beta <= alpha:
-                break  # Alpha pruning
-
-        return min_eval, best_move, best_white, best_black
+    With `endgame_empties` or fewer empty squares, a few shallow iterations
+    are followed by the exact endgame solver (see endgame_utils). If it
+    finishes within the budget the result is exact, otherwise the shallow
+    result is returned.
+
+    If an opening_book_utils.OpeningBook is given as `book` and has the
+    position, its move is returned without searching (with book: True).
+
+    `on_iteration`, if given, is called with a copy of the result after
+    every completed iteration, so callers can report progress.
+
+    Returns a dict with:
+    - best_move: Move (row, col), or None if `player` has no moves
+    - score: White - black score of the deepest completed iteration
+    - depth: Deepest completed depth (the number of empties when exact)
+    - exact: True if the score is the solved final disc differential
+    - nodes: Nodes searched over all iterations, including the aborted one
+    - cutoffs: Beta cutoffs over all iterations
+    - elapsed: Seconds spent
+    """
+    start = time.perf_counter()
+    if book is not None:
+        result = book.lookup(board, player)
+        if result is not None:
+            result["elapsed"] = time.perf_counter() - start
+            return result
+
+    white, black = bb.from_board(board)
+    empties = 64 - bb.popcount(white | black)
+    if max_depth is None or max_depth > empties:
+        max_depth = empties  # nothing deeper than the end of the game
+    if tt is None:
+        tt = TranspositionTable()
+
+    own, opp = bb.split_by_player(white, black, player)
+    h = zobrist_hash(white, black, player)
+    ctx = SearchContext(tt)
+    result = {"best_move": None, "score": None, "depth": 0, "exact": False,
+              "nodes": 0, "cutoffs": 0, "elapsed": 0.0}
+    solve_exactly = empties <= endgame_empties
+
+    for depth in range(1, max_depth + 1):
+        if solve_exactly and depth > ENDGAME_PRESEARCH_DEPTH:
+            # The shallow iterations have seeded the table with move ordering
+            # for the solver; now search to the end of the game
+            try:
+                score, best_sq = endgame_utils.solve(own, opp, player, ctx, h)
+            except SearchTimeout:
+                break
+            result["score"] = score * player
+            result["depth"] = empties
+            result["exact"] = True
+            result["best_move"] = bb.square_to_move(best_sq) if best_sq is not None else None
+            report_iteration(result, ctx, start, on_iteration)
+            break
+        try:
+            score, best_sq = negamax(own, opp, player, depth, float('-inf'), float('inf'), ctx, h)
+        except SearchTimeout:
+            break
+        result["score"] = score * player
+        result["depth"] = depth
+        # A search as deep as the number of empties already reached every game end
+        result["exact"] = depth >= empties
+        result["best_move"] = bb.square_to_move(best_sq) if best_sq is not None else None
+        report_iteration(result, ctx, start, on_iteration)
+        if best_sq is None or time.perf_counter() - start >= time_budget:
+            break
+        ctx.deadline = start + time_budget
+
+    result["nodes"] = ctx.nodes
+    result["cutoffs"] = ctx.cutoffs
+    result["elapsed"] = time.perf_counter() - start
+    return result
@@ -0,0 +1,201 @@
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from utils import bitboard_utils as bb
+from utils.optimal_positions_utils import SearchContext, SearchTimeout, negamax, order_moves, report_iteration
+from utils.transposition_utils import TranspositionTable, zobrist_hash
+from utils.worker_pool_utils import JobTimeout
+
+# Parallel root splitting. The root moves of a search are handed out to the
+# processes of a worker_pool_utils.WorkerPool: the expected best move is
+# searched first on its own to get a good alpha bound (young brothers wait),
+# then the remaining moves are searched at the same time. The coordinator
+# keeps the best score found so far and gives every move it hands out the
+# current bound, so moves started later get narrower windows.
+#
+# Each move is searched with a null window at alpha and only re-searched with a
+# full window if it beats alpha; the first move, before there is an alpha, is
+# searched with the full window straight away. A move that comes before the current best one
+# in the sequential search's root order would win a tie, so its window starts
+# one below alpha and a tie is scored exactly too. The result is therefore the
+# same score and move as negamax at the same depth.
+
+# Shallower searches are over before the processes would pay for themselves
+PARALLEL_MIN_DEPTH = 4
+
+# Transposition table of the current search in each worker process, reused by
+# every root move of that search the worker is given, in every iteration
+_search_tables = {}
+
+
+def _table(search_id, tt_size):
+    tt = _search_tables.get(search_id)
+    if tt is None:
+        _search_tables.clear()
+        tt = _search_tables[search_id] = TranspositionTable(tt_size)
+    return tt
+
+
+def search_root_move(own, opp, player, depth, sq, floor, deadline, search_id, tt_size):
+    """
+    Worker job: searches root move `sq` `depth` plies deep. Returns a dict
+    with the move's score (exact if above `floor`, otherwise an upper bound
+    no higher than it) and the search statistics, or None if `deadline`
+    (a time.time() value) passed first.
+    """
+    ctx = SearchContext(_table(search_id, tt_size))
+    if deadline is not None:
+        # perf_counter values are only comparable within one process
+        ctx.deadline = time.perf_counter() + (deadline - time.time())
+
+    flips = bb.get_flips(own, opp, sq)
+    new_own, new_opp = own | flips | (1 << sq), opp ^ flips
+    white, black = bb.join_by_player(new_own, new_opp, player)
+    h = zobrist_hash(white, black, -player)
+
+    try:
+        if floor == float('-inf'):
+            score = -negamax(new_opp, new_own, -player, depth - 1, float('-inf'), float('inf'), ctx, h, 1)[0]
+        else:
+            score = -negamax(new_opp, new_own, -player, depth - 1, -(floor + 1), -floor, ctx, h, 1)[0]
+            if score > floor:
+                score = -negamax(new_opp, new_own, -player, depth - 1, float('-inf'), -floor, ctx, h, 1)[0]
+    except SearchTimeout:
+        return None
+    return {"square": sq, "score": score, "exact": score > floor,
+            "nodes": ctx.nodes, "cutoffs": ctx.cutoffs}
+
+
+def parallel_negamax(own, opp, player, depth, pool, hash_move=None, deadline=None,
+                     tt_size=1 << 18, stats=None, search_id=None):
+    """
+    Searches the position `depth` plies deep with its root moves split over
+    `pool`. Same arguments and result as negamax with a full window, from
+    the point of view of the side to move: (score, best square or None).
+
+    `hash_move` (e.g. the previous iteration's best move) is searched first.
+    `deadline` is a time.time() value after which SearchTimeout is raised.
+    If given, `stats` is a dict whose nodes and cutoffs are incremented.
+    Calls with the same `search_id` reuse the workers' transposition tables,
+    so the iterations of one search share them; without one the tables
+    start empty.
+    """
+    moves = bb.get_moves(own, opp)
+    if depth < 2 or not moves or pool.workers < 2:
+        ctx = SearchContext(TranspositionTable(tt_size))
+        if deadline is not None:
+            ctx.deadline = time.perf_counter() + (deadline - time.time())
+        white, black = bb.join_by_player(own, opp, player)
+        result = negamax(own, opp, player, depth, float('-inf'), float('inf'), ctx,
+                         zobrist_hash(white, black, player))
+        if stats is not None:
+            stats["nodes"] += ctx.nodes
+            stats["cutoffs"] += ctx.cutoffs
+        return result
+
+    # Ties are broken by the order the sequential search tries root moves in
+    root_order = order_moves(moves, own | opp, SearchContext(), 0, player)
+    rank = {sq: i for i, sq in enumerate(root_order)}
+    if hash_move in rank:
+        root_order.remove(hash_move)
+        root_order.insert(0, hash_move)
+
+    if search_id is None:
+        search_id = str(uuid.uuid4())
+    alpha = float('-inf')
+    best_rank = len(rank)
+    results = []
+
+    def collect(result):
+        nonlocal alpha, best_rank
+        if result is None:
+            raise SearchTimeout()
+        if stats is not None:
+            stats["nodes"] += result["nodes"]
+            stats["cutoffs"] += result["cutoffs"]
+        if result["exact"]:
+            results.append(result)
+            if (result["score"], -rank[result["square"]]) > (alpha, -best_rank):
+                alpha, best_rank = result["score"], rank[result["square"]]
+
+    def submit(sq):
+        floor = alpha - 1 if rank[sq] < best_rank else alpha
+        return pool.submit(search_root_move, own, opp, player, depth, sq, floor, deadline,
+                           search_id, tt_size)
+
+    collect(pool.result(submit(root_order[0])))
+
+    pending = root_order[1:]
+    running = set()
+    try:
+        while pending or running:
+            while pending and len(running) < pool.workers:
+                running.add(submit(pending.pop(0)))
+            done, running = wait(running, timeout=pool.timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                raise JobTimeout(f"no root move finished within {pool.timeout}s")
+            for future in done:
+                collect(pool.result(future))
+    finally:
+        for future in running:
+            future.cancel()
+
+    best = max(results, key=lambda result: (result["score"], -rank[result["square"]]))
+    return best["score"], best["square"]
+
+
+def parallel_iterative_deepening(board, player, time_budget, pool, max_depth=None,
+                                 tt_size=1 << 18, book=None, on_iteration=None):
+    """
+    iterative_deepening with every iteration from PARALLEL_MIN_DEPTH on split
+    over `pool` (see parallel_negamax). Returns the same result dict and
+    reports iterations to `on_iteration` the same way. Endgame positions are
+    not handled here; use iterative_deepening for them.
+    """
+    start = time.perf_counter()
+    if book is not None:
+        result = book.lookup(board, player)
+        if result is not None:
+            result["elapsed"] = time.perf_counter() - start
+            return result
+
+    white, black = bb.from_board(board)
+    empties = 64 - bb.popcount(white | black)
+    if max_depth is None or max_depth > empties:
+        max_depth = empties
+
+    own, opp = bb.split_by_player(white, black, player)
+    h = zobrist_hash(white, black, player)
+    tt = TranspositionTable(tt_size)
+    ctx = SearchContext(tt)
+    stats = {"nodes": 0, "cutoffs": 0}
+    search_id = str(uuid.uuid4())
+    result = {"best_move": None, "score": None, "depth": 0, "exact": False,
+              "nodes": 0, "cutoffs": 0, "elapsed": 0.0}
+    deadline = None
+    best_sq = None
+
+    for depth in range(1, max_depth + 1):
+        try:
+            if depth < PARALLEL_MIN_DEPTH:
+                score, best_sq = negamax(own, opp, player, depth, float('-inf'), float('inf'), ctx, h)
+            else:
+                score, best_sq = parallel_negamax(own, opp, player, depth, pool, best_sq, deadline,
+                                                  tt_size, stats, search_id)
+        except SearchTimeout:
+            break
+        result["score"] = score * player
+        result["depth"] = depth
+        result["exact"] = depth >= empties
+        result["best_move"] = bb.square_to_move(best_sq) if best_sq is not None else None
+        report_iteration(result, ctx, start, on_iteration, stats["nodes"], stats["cutoffs"])
+        if best_sq is None or time.perf_counter() - start >= time_budget:
+            break
+        ctx.deadline = start + time_budget
+        deadline = time.time() + (ctx.deadline - time.perf_counter())
+
+    result["nodes"] = ctx.nodes + stats["nodes"]
+    result["cutoffs"] = ctx.cutoffs + stats["cutoffs"]
+    result["elapsed"] = time.perf_counter() - start
+    return result
@@ -1,8 +1,6 @@
 import cv2
-import matplotlib.pyplot as plt
 import numpy as np
-import os 
-import ast
+import os
 ################################################################################
 # Helper functions
 
@@ -119,23 +117,129 @@ def detect_piece(image, corners, i, j):
      
 
 
-def compare_board_states(board_state, board_index):
-    real_board_dir = 'Real_Board_Values/'
-    real_board_file = os.path.join(real_board_dir, f'board{board_index}.txt')
+# Vectorized classify_color_rgb: takes an array of colors with the channels on
+# the last axis and returns an array of -1 (black), 1 (white) and 0 (green)
+# using the same distances and tie-breaking.
+
+def classify_colors_rgb(avg_colors):
+  diff_w_s = np.sum(np.square(avg_colors - [1, 1, 1]), axis=-1)
+  diff_g_s = np.sum(np.square(avg_colors - [0, 0.8, 0]), axis=-1)
+  diff_b_s = np.sum(np.square(avg_colors - [0, 0, 0]), axis=-1)
+
+  is_black = (diff_b_s < diff_g_s) & (diff_b_s < diff_w_s)
+  is_white = (diff_w_s < diff_b_s) & (diff_w_s < diff_g_s)
+  return np.where(is_black, -1, np.where(is_white, 1, 0))
+
+
+################################################################################
+# This function warps the board to a square and returns the homography H from
+# the image to the warped board and the average color of the middle of each of
+# the 64 cells, shape (8, 8, 3), the same sub-region detect_piece uses.
+
+MAPPED_SIZE = 400
+
+def board_cell_colors(image, corners):
+  mapped_corners = np.array([
+    [0, 0],
+    [MAPPED_SIZE-1, 0],
+    [MAPPED_SIZE-1, MAPPED_SIZE-1],
+    [0, MAPPED_SIZE-1]
+  ], dtype=np.float32)
+
+  H = cv2.getPerspectiveTransform(corners, mapped_corners)
+  transformed = cv2.warpPerspective(image, H, (MAPPED_SIZE, MAPPED_SIZE))
+
+  ksize = 5
+  sigma = 3
+  blurred_image = blur_image(transformed, ksize, sigma)
+
+  # Split the warped board into an 8x8 grid of cells and keep the middle of
+  # each one
+  scale = int(MAPPED_SIZE / 8)
+  lo, hi = scale//4, scale-(scale//4)
+  cells = blurred_image[:scale*8, :scale*8].reshape(8, scale, 8, scale, -1)
+  regions = cells[:, lo:hi, :, lo:hi, :]
+  return H, np.mean(regions, axis=(1, 3))
 
-    # Read the real board values from the file
+################################################################################
+# This function projects the middle of every cell of the warped board back to
+# the image with one perspectiveTransform.
+# It returns a dict mapping each (row, col) to the (y, x) center of that cell
+# in the original image.
+
+def cell_centers(H):
+  scale = int(MAPPED_SIZE / 8)
+  lo, hi = scale//4, scale-(scale//4)
+
+  # Corners of every cell's sub-region in warped space, shape (8, 8, 4, 2)
+  offsets = np.arange(8) * scale
+  x1 = np.broadcast_to(offsets + lo, (8, 8))
+  y1 = x1.T
+  x2, y2 = x1 + (hi-lo), y1 + (hi-lo)
+  corners_warped = np.stack([
+    np.stack([x1, y1], axis=-1),
+    np.stack([x2, y1], axis=-1),
+    np.stack([x2, y2], axis=-1),
+    np.stack([x1, y2], axis=-1)
+  ], axis=2).astype(np.float32).reshape(-1, 1, 2)
+
+  H_inv = np.linalg.inv(H)
+  corners_original = cv2.perspectiveTransform(corners_warped, H_inv)
+  centers = np.mean(corners_original.reshape(8, 8, 4, 2), axis=2)
+
+  dict_board = {}
+  for row in range(8):
+    for col in range(8):
+      avg_x, avg_y = centers[row, col]
+      dict_board[(row, col)] = (avg_y, avg_x)
+  return dict_board
+
+################################################################################
+# This function reads the whole board at once. It gives the same result as
+# calling detect_piece for all 64 cells, but warps and blurs the image a single
+# time, averages every cell's sub-region with one reduction and projects all
+# cell regions back to the original image with one perspectiveTransform.
+# It returns the 8x8 board state and a dict mapping each (row, col) to the
+# (y, x) center of that cell in the original image.
+
+def detect_board(image, corners):
+  try:
+    H, avg_bgr = board_cell_colors(image, corners)
+    board_state = classify_colors_rgb(avg_bgr[..., ::-1]).astype(float)
+    return board_state, cell_centers(H)
+  except Exception as e:
+    raise RuntimeError(f"piece_detection_failed: {e}")
+
+
+
+################################################################################
+# Hand-labelled boards of the photos in Test_Images: board<N>.txt holds the
+# board of Othello_Game_Board<N>.png as a Python list of 8 rows of -1/0/1.
+# Which corner of a photo is the first row is arbitrary, so detected boards are
+# compared in whichever of the 8 rotations and mirror images matches best.
+
+REAL_BOARD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Test_Images', 'Real_Board_Values')
+
+def load_real_board(board_index, real_board_dir=REAL_BOARD_DIR):
+    import ast
+
+    real_board_file = os.path.join(real_board_dir, f'board{board_index}.txt')
     with open(real_board_file, 'r') as f:
-        real_board_state = ast.literal_eval(f.read())
+        return np.array(ast.literal_eval(f.read()))
+
+# Returns how many of the 64 cells of board_state match the real board.
 
-    # Convert to numpy arrays for easy comparison
-    real_board_state = np.array(real_board_state)
+def compare_board_states(board_state, board_index, real_board_dir=REAL_BOARD_DIR):
+    real_board_state = load_real_board(board_index, real_board_dir)
     detected_board_state = np.array(board_state)
 
-    # Calculate total matches
-    matches = np.sum(real_board_state == detected_board_state)
+    # Calculate total matches in the best orientation
+    orientations = [np.rot90(board, k) for board in (detected_board_state, np.fliplr(detected_board_state))
+                    for k in range(4)]
+    matches = max(int(np.sum(real_board_state == board)) for board in orientations)
     individual_accuracy = (matches / (64)) * 100
     # print(f"Individual Accuracy:  {individual_accuracy:.2f}%")
     true_score = np.sum(real_board_state)
     detected_score = np.sum(detected_board_state)
     # print(f"True Score: {true_score}, Detected_Score: {detected_score}\n")
-    return matches
\ No newline at end of file
+    return matches
@@ -0,0 +1,616 @@
+import base64
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils import bitboard_utils as bb
+from utils import hough_utils, metrics_utils, piece_detection_utils, optimal_positions_utils, storage_utils, result_cache_utils
+from utils.analysis_cache_utils import AnalysisCache
+from utils.endgame_utils import ENDGAME_EMPTIES
+from utils.metrics_utils import span
+from utils.opening_book_utils import BOOK_PATH, load_book, starting_position
+from utils.parallel_search_utils import parallel_iterative_deepening
+from utils.transposition_utils import TranspositionTable
+from utils.worker_pool_utils import JobTimeout, WorkerCrashed, WorkerPool
+
+# The image -> board -> best moves pipeline behind /predict, shared by the
+# Flask app, /predict/batch and scripts/predict_batch.py. Corner and piece
+# detection and the searches run in a pool of worker processes (see
+# worker_pool_utils); caching, drawing and storage stay in the caller. Every
+# stage is timed with a metrics_utils span.
+
+logger = logging.getLogger(__name__)
+
+
+def load_config(environ=os.environ):
+    """
+    Reads the pipeline settings from OTHELLO_* environment variables (see
+    the README) into a dict.
+    """
+    return {
+        # Transposition table sizing. By default each search gets its own table;
+        # OTHELLO_TT_SHARED=1 keeps one table for the lifetime of each worker process
+        # so positions seen in earlier requests are reused.
+        "TT_SIZE": int(environ.get("OTHELLO_TT_SIZE", 1 << 18)),
+        "TT_SHARED": environ.get("OTHELLO_TT_SHARED", "0") == "1",
+        # Search time budget in seconds for both sides together. A request can ask for
+        # a different budget with a `time_budget` form field, capped at
+        # SEARCH_MAX_TIME_BUDGET. SEARCH_MAX_DEPTH optionally caps the depth too.
+        "SEARCH_TIME_BUDGET": float(environ.get("OTHELLO_SEARCH_TIME_BUDGET", 1.0)),
+        "SEARCH_MAX_TIME_BUDGET": float(environ.get("OTHELLO_SEARCH_MAX_TIME_BUDGET", 10.0)),
+        "SEARCH_MAX_DEPTH": int(environ["OTHELLO_SEARCH_MAX_DEPTH"]) if "OTHELLO_SEARCH_MAX_DEPTH" in environ else None,
+        # Positions with this many empty squares or fewer are solved exactly
+        "ENDGAME_EMPTIES": int(environ.get("OTHELLO_ENDGAME_EMPTIES", ENDGAME_EMPTIES)),
+        # Board masking for corner detection: "rgb" chroma key or "hsv" green hue
+        "MASK_MODE": environ.get("OTHELLO_MASK_MODE", "rgb"),
+        # Corners are detected on a copy of the upload whose longer side is at most
+        # this many pixels; 0 runs corner detection at full resolution
+        "CORNER_MAX_SIDE": int(environ.get("OTHELLO_CORNER_MAX_SIDE", 800)),
+        # Line grouping and intersection clustering for corner detection: "numpy" or
+        # the original scikit-learn DBSCAN + KMeans path ("sklearn")
+        "CORNER_CLUSTERING": environ.get("OTHELLO_CORNER_CLUSTERING", "numpy"),
+        # Submissions database (created or migrated once at startup) and the
+        # directory of the content-addressed image store
+        "DB_PATH": environ.get("OTHELLO_DB_PATH", storage_utils.DB_PATH),
+        "BLOB_DIR": environ.get("OTHELLO_BLOB_DIR", storage_utils.BLOB_DIR),
+        # Results of earlier uploads, keyed on the hash of the uploaded bytes: an
+        # in-memory LRU of at most RESULT_CACHE_MB backed by the submissions store
+        "RESULT_CACHE_MB": float(environ.get("OTHELLO_RESULT_CACHE_MB", 64)),
+        # Search results per board position (up to rotation and mirroring), kept in
+        # memory and in the submissions database so they survive restarts
+        "ANALYSIS_CACHE_SIZE": int(environ.get("OTHELLO_ANALYSIS_CACHE_SIZE", 4096)),
+        # Opening book consulted before searching (see scripts/build_opening_book.py);
+        # OTHELLO_OPENING_BOOK="" disables it
+        "OPENING_BOOK": environ.get("OTHELLO_OPENING_BOOK", BOOK_PATH),
+        # Images analysed at once by predict_many
+        "BATCH_WORKERS": int(environ.get("OTHELLO_BATCH_WORKERS", os.cpu_count() or 1)),
+        # Worker processes for detection and search (0 runs them in the request
+        # thread) and how long a request waits for one of their jobs
+        "PROCESS_WORKERS": int(environ.get("OTHELLO_PROCESS_WORKERS", os.cpu_count() or 1)),
+        "JOB_TIMEOUT": float(environ.get("OTHELLO_JOB_TIMEOUT", 30.0)),
+        # Split the root moves of each search over the worker processes instead of
+        # giving each search one process (endgame positions are always solved on one)
+        "PARALLEL_SEARCH": environ.get("OTHELLO_PARALLEL_SEARCH", "0") == "1",
+        # Background threads running /jobs analyses, and how long a running job may
+        # go without progress before a restarted server runs it again
+        "ASYNC_WORKERS": int(environ.get("OTHELLO_ASYNC_WORKERS", os.cpu_count() or 1)),
+        "ASYNC_STALE_AFTER": float(environ.get("OTHELLO_ASYNC_STALE_AFTER", 120.0)),
+        # Default format ("png", "jpeg" or "webp") and quality (JPEG/WebP) of the
+        # annotated image; requests can ask for others with `format` and `quality`
+        "IMAGE_FORMAT": environ.get("OTHELLO_IMAGE_FORMAT", "png"),
+        "IMAGE_QUALITY": int(environ.get("OTHELLO_IMAGE_QUALITY", 85)),
+        # Live streams (see stream_utils) are closed after this many seconds without a frame
+        "STREAM_IDLE_TIMEOUT": float(environ.get("OTHELLO_STREAM_IDLE_TIMEOUT", 300.0)),
+        # Whole-game analysis (see game_analysis_utils): search depth of every ply and
+        # the disc loss from which a move counts as a blunder
+        "GAME_DEPTH": int(environ.get("OTHELLO_GAME_DEPTH", 6)),
+        "BLUNDER_THRESHOLD": int(environ.get("OTHELLO_BLUNDER_THRESHOLD", 6)),
+        # Lowest level of the log records written to stderr (DEBUG adds every span)
+        "LOG_LEVEL": environ.get("OTHELLO_LOG_LEVEL", "INFO"),
+    }
+
+
+# Annotated image formats: PIL format name and MIME type
+IMAGE_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+def encode_image(image, image_format="png", quality=85):
+    """Encodes an RGB uint8 array as `image_format` (a key of IMAGE_FORMATS)."""
+    pil_format, _ = IMAGE_FORMATS[image_format]
+    buffered = BytesIO()
+    if pil_format == "PNG":
+        Image.fromarray(image).save(buffered, format="PNG")
+    else:
+        Image.fromarray(image).save(buffered, format=pil_format, quality=quality)
+    return buffered.getvalue()
+
+
+# Longest side in pixels of the previews the history listing links to
+THUMBNAIL_SIZE = 160
+
+
+def make_thumbnail(image):
+    """Small JPEG preview of an RGB uint8 array, for the history listing."""
+    thumbnail = Image.fromarray(image)
+    thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    buffered = BytesIO()
+    thumbnail.save(buffered, format="JPEG", quality=70)
+    return buffered.getvalue()
+
+
+def json_response(response):
+    """Returns a copy of a predict response with the annotated image base64 encoded for JSON."""
+    response = dict(response)
+    if response.get("image") is not None:
+        response["image"] = base64.b64encode(response["image"]).decode("utf-8")
+    return response
+
+
+def search_report(result):
+    report = {
+        "depth": result["depth"],
+        "nodes": result["nodes"],
+        "cutoffs": result["cutoffs"],
+        "elapsed_ms": round(result["elapsed"] * 1000, 1),
+        "exact": result["exact"],
+        "cached": result.get("cached", False),
+        "book": result.get("book", False)
+    }
+    if result["exact"]:
+        # Solved to the end of the game: white - black discs with best play
+        report["final_disc_differential"] = result["score"]
+    return report
+
+
+# Opening books and the worker-lifetime transposition table of this process,
+# so each pool worker loads and allocates them once
+_books = {}
+_shared_tts = {}
+
+
+def get_opening_book(path):
+    if path not in _books:
+        _books[path] = load_book(path) if path else None
+    return _books[path]
+
+
+def get_transposition_table(config):
+    """
+    Returns a fresh table, or with TT_SHARED the table this process keeps
+    across searches.
+    """
+    if not config["TT_SHARED"]:
+        return TranspositionTable(config["TT_SIZE"])
+    tt = _shared_tts.get(config["TT_SIZE"])
+    if tt is None:
+        tt = _shared_tts[config["TT_SIZE"]] = TranspositionTable(config["TT_SIZE"])
+    tt.new_search()
+    return tt
+
+
+def warm_worker(config):
+    """Pool worker initializer: sets up logging, loads the opening book and runs a short search."""
+    metrics_utils.configure_logging(config["LOG_LEVEL"])
+    get_opening_book(config["OPENING_BOOK"])
+    get_transposition_table(config)
+    board = bb.to_board(*starting_position())
+    optimal_positions_utils.iterative_deepening(board, -1, 0.0, max_depth=3)
+
+
+def locate_board(img_np, config):
+    """
+    Corner and piece detection on an RGB uint8 image. Returns a dict with
+    corners, board_state and dict_board, or with an error code.
+    """
+    img_rgb = np.float32(img_np) / 255.0
+    corners = hough_utils.hough_downscaled(
+        img_rgb, config["CORNER_MAX_SIDE"], config["MASK_MODE"], config["CORNER_CLUSTERING"]
+    )
+    if corners.shape != (4, 2):
+        logger.warning("Hough failed to detect exactly 4 corners")
+        return {"error": "corner_detection_failed"}
+
+    corners_list = corners.tolist()
+    logger.info("4 corners: %s", corners_list)
+
+    #Detect every piece with a single warp of the board
+    #dict_board maps each position on the 2D board_state array to its actual coordinate in the original image, so that when we get a recommended move on the 2D array we can easily obtain the actual coordinate on the original board
+    try:
+        with span("cells"):
+            board_state, dict_board = piece_detection_utils.detect_board(img_rgb, corners)
+    except Exception as e:
+        logger.warning("Piece detection failed: %s", e)
+        return {"error": "piece_detection_failed"}
+    return {"corners": corners_list, "board_state": board_state, "dict_board": dict_board}
+
+
+SIDES = {1: "white", -1: "black"}
+
+
+def game_status(board_state):
+    """
+    Returns (white_score, black_score, players, lead message) for a detected
+    board, where players are the sides with a legal move to search for.
+    There are none before the game starts and once it is over.
+    """
+    _, white_score, black_score = optimal_positions_utils.evaluate_board(board_state)
+
+    # Check for special board states
+    board_is_empty = not np.any(board_state != 0)
+    board_is_full = not np.any(board_state == 0)
+
+    # Check valid moves
+    white_moves = optimal_positions_utils.get_valid_moves(board_state, player=1)
+    black_moves = optimal_positions_utils.get_valid_moves(board_state, player=-1)
+
+    if board_is_empty:
+        return white_score, black_score, [], "No pieces on the board yet — the game hasn’t started."
+    if board_is_full or (not white_moves and not black_moves):
+        if white_score > black_score:
+            lead_message = "Game over. ⚪ White wins!"
+        elif black_score > white_score:
+            lead_message = "Game over. ⚫ Black wins!"
+        else:
+            lead_message = "Game over. It’s a tie!"
+        return white_score, black_score, [], lead_message
+
+    # Ongoing game status
+    if white_score > black_score:
+        lead_message = "White is currently in the lead."
+    elif black_score > white_score:
+        lead_message = "Black is currently in the lead."
+    else:
+        lead_message = "The game is currently tied."
+    players = [player for player, moves in ((1, white_moves), (-1, black_moves)) if moves]
+    return white_score, black_score, players, lead_message
+
+
+def progress_callback(job_id, player, db_path):
+    """
+    Returns an on_iteration callback that records `player`'s search
+    progress on the job (see job_utils), or None when there is no job.
+    """
+    if job_id is None:
+        return None
+
+    def on_iteration(result):
+        progress = {"best_move": result["best_move"], **search_report(result)}
+        storage_utils.update_job(job_id, path=db_path, **{SIDES[player]: json.dumps(progress)})
+    return on_iteration
+
+
+def search_position(board_state, player, time_budget, config, job_id=None):
+    """
+    iterative_deepening for `player` with the configured limits, plus the
+    transposition table hits and misses of the search. With a job_id every
+    completed iteration is recorded on the job.
+    """
+    with span("search", side=SIDES[player]) as attributes:
+        tt = get_transposition_table(config)
+        tt_hits, tt_misses = tt.hits, tt.misses
+        result = optimal_positions_utils.iterative_deepening(
+            board_state, player, time_budget, config["SEARCH_MAX_DEPTH"], tt,
+            config["ENDGAME_EMPTIES"], get_opening_book(config["OPENING_BOOK"]),
+            progress_callback(job_id, player, config["DB_PATH"])
+        )
+        result["tt_hits"] = tt.hits - tt_hits
+        result["tt_misses"] = tt.misses - tt_misses
+        attributes.update(depth=result["depth"], nodes=result["nodes"])
+    return result
+
+
+class Pipeline:
+    """
+    Runs the whole analysis of one uploaded photo: result cache lookup,
+    corner detection, piece detection, the search for both sides, the
+    annotated image and (optionally) storing the submission. Holds the
+    caches and the worker pool so every caller in a process reuses them.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        storage_utils.init_db(config["DB_PATH"])
+        self.result_cache = result_cache_utils.ResultCache(
+            int(config["RESULT_CACHE_MB"] * (1 << 20)), config["DB_PATH"], config["BLOB_DIR"]
+        )
+        self.analysis_cache = AnalysisCache(config["ANALYSIS_CACHE_SIZE"], config["DB_PATH"])
+        self.pool = WorkerPool(
+            config["PROCESS_WORKERS"], config["JOB_TIMEOUT"], preload=["utils.pipeline_utils"],
+            initializer=warm_worker, initargs=(config,)
+        )
+
+    def close(self):
+        """Stops the worker pool once running jobs finish."""
+        self.pool.shutdown()
+
+    def run_traced(self, fn, *args):
+        """pool.run(fn, *args), adding the spans the worker recorded to the current trace."""
+        result, spans = self.pool.run(metrics_utils.call_traced, fn, *args)
+        metrics_utils.add_spans(spans)
+        return result
+
+    def time_budget(self, value=None):
+        """Parses a requested time budget, falling back to the default and capping it."""
+        try:
+            budget = float(value) if value is not None else self.config["SEARCH_TIME_BUDGET"]
+        except ValueError:
+            budget = self.config["SEARCH_TIME_BUDGET"]
+        return min(max(budget, 0.0), self.config["SEARCH_MAX_TIME_BUDGET"])
+
+    def output_options(self, image_format=None, quality=None, annotate=None):
+        """
+        Parses the requested annotated image options, falling back to the
+        configured defaults. Returns a dict with format, quality and
+        annotate (False when the client draws the markers from `moves`).
+        """
+        image_format = (image_format or self.config["IMAGE_FORMAT"]).lower()
+        image_format = "jpeg" if image_format == "jpg" else image_format
+        if image_format not in IMAGE_FORMATS:
+            image_format = self.config["IMAGE_FORMAT"]
+        try:
+            quality = int(quality) if quality is not None else self.config["IMAGE_QUALITY"]
+        except ValueError:
+            quality = self.config["IMAGE_QUALITY"]
+        annotate = annotate not in (False, "0", "false", "no")
+        return {"format": image_format, "quality": min(max(quality, 1), 100), "annotate": annotate}
+
+    def parallel_search(self, board_state):
+        """Whether the searches of this position are split over the workers (PARALLEL_SEARCH)."""
+        empties = int(np.sum(board_state == 0))
+        return (self.config["PARALLEL_SEARCH"] and self.pool.workers > 1
+                and empties > self.config["ENDGAME_EMPTIES"])
+
+    def analyse_positions(self, board_state, players, time_budget, job_id=None):
+        """
+        Returns {player: result} with the best move of each of `players`,
+        sharing `time_budget` between them. Positions with a usable cached
+        analysis are answered from it; the rest are searched at the same
+        time on the worker pool. With a job_id progress is recorded on the job.
+        """
+        budget = time_budget / len(players)
+        results = {player: self.analysis_cache.get(board_state, player, budget) for player in players}
+        misses = [player for player in players if results[player] is None]
+        for player in players:
+            if results[player] is not None and job_id is not None:
+                progress_callback(job_id, player, self.config["DB_PATH"])(results[player])
+        if misses:
+            # Sides answered from the cache leave their share to the others
+            budget = time_budget / len(misses)
+            if self.parallel_search(board_state):
+                # Each side in turn, using every worker
+                for player in misses:
+                    with span("search", side=SIDES[player], parallel=True) as attributes:
+                        results[player] = parallel_iterative_deepening(
+                            board_state, player, budget, self.pool, self.config["SEARCH_MAX_DEPTH"],
+                            self.config["TT_SIZE"], get_opening_book(self.config["OPENING_BOOK"]),
+                            progress_callback(job_id, player, self.config["DB_PATH"])
+                        )
+                        attributes.update(depth=results[player]["depth"], nodes=results[player]["nodes"])
+                    self.analysis_cache.put(board_state, player, budget, results[player])
+                return results
+            futures = {player: self.pool.submit(metrics_utils.call_traced, search_position, board_state, player,
+                                                budget, self.config, job_id)
+                       for player in misses}
+            for player, future in futures.items():
+                results[player], spans = self.pool.result(future)
+                metrics_utils.add_spans(spans)
+                self.analysis_cache.put(board_state, player, budget, results[player])
+        return results
+
+    def predict(self, upload, original_filename, time_budget=None, store=True, job_id=None, output=None,
+                profile=False):
+        """
+        Analyses the uploaded image bytes. Returns (response, status) where
+        response is the /predict body as a dict, with the annotated image as
+        raw bytes (see json_response) of image_type and the best moves'
+        squares and image coordinates under moves. `output` is a dict from
+        output_options; without annotate no image is drawn. With
+        store=False the submission is not written to the database. With a
+        job_id the detected board and the search progress are recorded on
+        that job as they become available. With profile=True the response
+        has a profile with the time taken by every stage.
+        """
+        start = time.perf_counter()
+        with metrics_utils.trace() as spans:
+            response, status = self._predict(upload, original_filename, time_budget, store, job_id, output)
+        metrics_utils.record_spans(spans)
+        if profile:
+            response["profile"] = {"total_ms": round((time.perf_counter() - start) * 1000, 3), "stages": spans}
+        return response, status
+
+    def _predict(self, upload, original_filename, time_budget, store, job_id, output):
+        time_budget = self.time_budget(time_budget)
+        output = output or self.output_options()
+        image_type = IMAGE_FORMATS[output["format"]][1] if output["annotate"] else None
+        variant = f"{output['format']}:{output['quality']}" if output["annotate"] else "moves"
+
+        #Answer repeated uploads of the same bytes from the result cache
+        with span("result_cache") as attributes:
+            upload_key = result_cache_utils.upload_hash(upload)
+            cached, tier = self.result_cache.get(upload_key, image_type, variant)
+            attributes["result"] = tier or "miss"
+        metrics_utils.CACHE_LOOKUPS.inc(cache="result", result=tier or "miss")
+        if cached is not None:
+            logger.info("Result cache hit (%s)", tier)
+            return {**cached, "cache": tier}, 200
+
+        #Extract the image and convert to RGB
+        with span("decode"):
+            img_pil = Image.open(BytesIO(upload)).convert("RGB")
+            img_np = np.array(img_pil)
+
+        try:
+            return self._analyse(upload, img_np, upload_key, original_filename, time_budget, store,
+                                 job_id, output, variant)
+        except JobTimeout as e:
+            logger.warning("Analysis timed out: %s", e)
+            return {"error": "analysis_timeout"}, 504
+        except WorkerCrashed as e:
+            logger.error("Analysis failed: %s", e)
+            return {"error": "internal_error"}, 500
+
+    def _analyse(self, upload, img_np, upload_key, original_filename, time_budget, store, job_id,
+                 output, variant):
+        #Detect 4 corners, then every piece, on a worker
+        located = self.run_traced(locate_board, img_np, self.config)
+        if "error" in located:
+            return {"error": located["error"]}, 400
+        board_state, dict_board = located["board_state"], located["dict_board"]
+
+        # Obtain actual scores on current board so that we don't detect score when recommened moves shown (score of original board)
+        white_score, black_score, players, lead_message = game_status(board_state)
+        if job_id is not None:
+            # cells holds the (y, x) image coordinates of each square's centre
+            storage_utils.update_job(job_id, path=self.config["DB_PATH"], board=json.dumps({
+                "board_state": board_state.astype(int).tolist(),
+                "corners": located["corners"],
+                "cells": [[[float(v) for v in dict_board[(row, col)]] for col in range(8)] for row in range(8)],
+                "white_score": int(white_score),
+                "black_score": int(black_score),
+            }))
+
+        white_best = black_best = original_coordinates_white_best = original_coordinates_black_best = None
+        search_stats = {"time_budget": time_budget}
+        # Table sizes are rounded down to a power of two
+        tt_stats = {"hits": 0, "misses": 0, "size": 1 << (self.config["TT_SIZE"].bit_length() - 1)}
+
+        # Skip move prediction before the game starts and once it is over
+        if players:
+            # Both sides are searched at once, splitting the budget between
+            # the sides that have a move
+            results = self.analyse_positions(board_state, players, time_budget, job_id)
+            for player, result in results.items():
+                metrics_utils.record_search(SIDES[player], result)
+                tt_stats["hits"] += result.get("tt_hits", 0)
+                tt_stats["misses"] += result.get("tt_misses", 0)
+
+            if 1 in results:
+                white_result = results[1]
+                white_best = white_result["best_move"]
+                search_stats["white"] = search_report(white_result)
+                original_coordinates_white_best = dict_board[white_best]
+                logger.info("White optimal move: %s (depth %s, %s nodes), coordinates on original image: %s",
+                            white_best, white_result['depth'], white_result['nodes'], original_coordinates_white_best)
+            else:
+                logger.info("White has no valid moves")
+
+            if -1 in results:
+                black_result = results[-1]
+                black_best = black_result["best_move"]
+                search_stats["black"] = search_report(black_result)
+                original_coordinates_black_best = dict_board[black_best]
+                logger.info("Black optimal move: %s (depth %s, %s nodes), coordinates on original image: %s",
+                            black_best, black_result['depth'], black_result['nodes'], original_coordinates_black_best)
+            else:
+                logger.info("Black has no valid moves")
+
+            logger.info("Transposition table: %s hits, %s misses", tt_stats['hits'], tt_stats['misses'])
+
+        # Best moves as board squares and image coordinates, so clients can
+        # draw the markers themselves
+        moves = {"white": None, "black": None}
+        for side, move, coordinates in (("white", white_best, original_coordinates_white_best),
+                                        ("black", black_best, original_coordinates_black_best)):
+            if move:
+                moves[side] = {"square": list(move), "y": float(coordinates[0]), "x": float(coordinates[1])}
+
+        # Draw and encode the annotated image with best moves (if applicable)
+        img_bytes = image_type = None
+        if output["annotate"]:
+            with span("annotate", format=output["format"]):
+                img_annotated = draw_optimal_moves(
+                    img_np,
+                    original_coordinates_white_best if white_best else None,
+                    original_coordinates_black_best if black_best else None
+                )
+                img_bytes = encode_image(img_annotated, output["format"], output["quality"])
+            image_type = IMAGE_FORMATS[output["format"]][1]
+
+        result = {
+            "image": img_bytes,
+            "image_type": image_type,
+            "white_score": int(white_score),
+            "black_score": int(black_score),
+            "lead": lead_message,
+            "moves": moves
+        }
+        self.result_cache.put(upload_key, result, variant)
+
+        # Store in database; the original is kept exactly as uploaded
+        if store:
+            submission_id = str(uuid.uuid4())
+            try:
+                with span("store"):
+                    saved = storage_utils.save_submission(
+                        submission_id, original_filename, upload, img_bytes,
+                        int(white_score), int(black_score), lead_message, image_type=image_type,
+                        upload_hash=upload_key, path=self.config["DB_PATH"], blob_dir=self.config["BLOB_DIR"],
+                        original_type=storage_utils.sniff_image_type(upload), moves=moves,
+                        thumbnail=make_thumbnail(img_np)
+                    )
+                if saved:
+                    logger.info("Submission saved with ID %s", submission_id)
+                else:
+                    logger.info("Image '%s' was already submitted. Skipping insert.", original_filename)
+            except Exception as e:
+                logger.error("Failed to save to database: %s", e)
+
+        return {
+            **result,
+            "cache": "miss",
+            "search": search_stats,
+            "transposition_table": tt_stats
+        }, 200
+
+    def predict_many(self, uploads, time_budget=None, store=True, workers=None, output=None):
+        """
+        Analyses [(filename, bytes)] on `workers` threads (BATCH_WORKERS by
+        default) and yields (index, filename, response, status) for each image
+        as soon as it is done, so callers can stream results. `output` is
+        passed on to predict.
+        """
+        workers = max(1, min(workers or self.config["BATCH_WORKERS"], len(uploads) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self.predict, upload, filename, time_budget, store, None, output): (index, filename)
+                for index, (filename, upload) in enumerate(uploads)
+            }
+            for future in as_completed(futures):
+                index, filename = futures[future]
+                try:
+                    response, status = future.result()
+                except Exception as e:
+                    logger.exception("Failed to analyse '%s': %s", filename, e)
+                    response, status = {"error": "internal_error"}, 500
+                yield index, filename, response, status
+
+
+def draw_optimal_moves(image, white_coord=None, black_coord=None):
+    """
+    Draws circle markers with red outlines on the image at the specified white and black
+    optimal move coordinates.
+
+    Parameters:
+    - image: np.ndarray (uint8 RGB image, or float32 normalized to 0–1)
+    - white_coord: Tuple (y, x) or None
+    - black_coord: Tuple (y, x) or None
+    - marker_radius: int or None — if None, will be computed based on image size
+
+    Returns:
+    - image with circles drawn (as np.uint8 RGB image)
+    """
+    if image.dtype == np.uint8:
+        image_copy = image.copy()
+    else:
+        image_copy = (image * 255).astype("uint8")
+    height, width = image_copy.shape[:2]
+    cell_size = min(height, width) / 8
+    marker_radius = int(cell_size * 0.25)  # 30% of a cell; adjust 0.3 if needed
+    marker_radius = max(3, marker_radius)
+    logger.debug("marker_radius: %s", marker_radius)
+
+    if white_coord:
+        x_w = int(round(white_coord[1]))
+        y_w = int(round(white_coord[0]))
+        cv2.circle(image_copy, (x_w, y_w), marker_radius + 4, (255, 0, 0), -1)      # Red border
+        cv2.circle(image_copy, (x_w, y_w), marker_radius, (255, 255, 255), -1)     # White fill
+
+    if black_coord:
+        x_b = int(round(black_coord[1]))
+        y_b = int(round(black_coord[0]))
+        cv2.circle(image_copy, (x_b, y_b), marker_radius + 4, (255, 0, 0), -1)      # Red border
+        cv2.circle(image_copy, (x_b, y_b), marker_radius, (0, 0, 0), -1)           # Black fill
+
+    return image_copy
@@ -0,0 +1,107 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from utils import storage_utils
+
+
+# Rough memory of an entry besides its image (the result dict, scores, lead
+# message and moves), so results without an image still count towards the cap
+ENTRY_OVERHEAD = 1024
+
+
+def upload_hash(data):
+    """Cache key of an upload: the SHA-256 hex digest of its raw bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of /predict results keyed on the hash of the uploaded
+    bytes, so a photo that was already analysed skips corner detection,
+    piece detection and search entirely.
+
+    The first tier is an in-memory LRU capped at `max_bytes`, counting each
+    entry as its annotated image plus ENTRY_OVERHEAD. Its entries are also keyed on a `variant` string describing the
+    requested output (format, quality), since the same upload can be
+    answered with different images. On a miss the submissions store is
+    checked for a row with the same upload hash whose annotated image has
+    the requested `image_type` (or any row with moves if no image is
+    wanted), and a hit there is promoted into memory. Each result is a dict
+    with the annotated image bytes and image_type (both None when no image
+    was drawn), white_score, black_score, lead and moves.
+    """
+
+    def __init__(self, max_bytes=64 << 20, db_path=storage_utils.DB_PATH,
+                 blob_dir=storage_utils.BLOB_DIR):
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self.blob_dir = blob_dir
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def size(result):
+        return ENTRY_OVERHEAD + len(result["image"] or b"")
+
+    def get(self, key, image_type=None, variant=""):
+        """Returns (result, tier) with tier "memory" or "store", or (None, None)."""
+        entry_key = f"{key}:{variant}"
+        with self.lock:
+            result = self.entries.get(entry_key)
+            if result is not None:
+                self.entries.move_to_end(entry_key)
+                self.memory_hits += 1
+                return result, "memory"
+
+        result = storage_utils.get_result_by_upload_hash(key, self.db_path, self.blob_dir)
+        if result is not None:
+            if image_type is None:
+                result = {**result, "image": None, "image_type": None} if result["moves"] is not None else None
+            elif result["image_type"] != image_type:
+                result = None
+        with self.lock:
+            if result is None:
+                self.misses += 1
+                return None, None
+            self.store_hits += 1
+        self.put(key, result, variant)
+        return result, "store"
+
+    def put(self, key, result, variant=""):
+        entry_key = f"{key}:{variant}"
+        size = self.size(result)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if entry_key in self.entries:
+                self.bytes -= self.size(self.entries.pop(entry_key))
+            self.entries[entry_key] = result
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= self.size(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.memory_hits = self.store_hits = self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.memory_hits + self.store_hits + self.misses
+            hits = self.memory_hits + self.store_hits
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,551 @@
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Submissions database. Every thread of every worker process keeps one open
+# connection per database file instead of reconnecting on each request; the
+# schema is created and migrated once, when the server starts.
+DB_PATH = "submissions.db"
+
+# Images are kept out of the database in a content-addressed store: each one
+# is written once as raw bytes to BLOB_DIR/<first 2 hex digits>/<sha256>, and
+# submissions reference it by hash.
+BLOB_DIR = "submission_images"
+
+# Connection settings: WAL lets readers run while a writer commits, NORMAL
+# sync is safe with WAL, and busy_timeout makes writers wait for the lock
+# instead of failing with "database is locked".
+BUSY_TIMEOUT_MS = 5000
+PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",  # 16 MB page cache
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+]
+
+# Schema migrations; migration i brings a database from user_version i to
+# i + 1. Databases created before migrations existed are at version 0 and
+# already have the submissions table, hence IF NOT EXISTS.
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS submissions (
+        id TEXT PRIMARY KEY,
+        timestamp TEXT,
+        original_filename TEXT UNIQUE,  -- Prevent duplicates
+        original_image_base64 TEXT,
+        result_image_base64 TEXT,
+        white_score INTEGER,
+        black_score INTEGER,
+        lead_message TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_submissions_timestamp ON submissions (timestamp);
+    """,
+    # Images move to the blob store and duplicates are detected by image
+    # hash instead of filename. Existing rows keep their base64 columns until
+    # scripts/migrate_image_blobs.py moves them.
+    """
+    CREATE TABLE submissions_v2 (
+        id TEXT PRIMARY KEY,
+        timestamp TEXT,
+        original_filename TEXT,
+        original_image_hash TEXT,
+        original_image_type TEXT,
+        result_image_hash TEXT,
+        result_image_type TEXT,
+        white_score INTEGER,
+        black_score INTEGER,
+        lead_message TEXT,
+        original_image_base64 TEXT,
+        result_image_base64 TEXT
+    );
+    INSERT INTO submissions_v2 (
+        id, timestamp, original_filename, white_score, black_score, lead_message,
+        original_image_base64, result_image_base64
+    )
+    SELECT id, timestamp, original_filename, white_score, black_score, lead_message,
+           original_image_base64, result_image_base64
+    FROM submissions;
+    DROP TABLE submissions;
+    ALTER TABLE submissions_v2 RENAME TO submissions;
+    CREATE INDEX idx_submissions_timestamp ON submissions (timestamp);
+    CREATE INDEX idx_submissions_original_hash ON submissions (original_image_hash);
+    """,
+    # Hash of the uploaded bytes, so a repeated upload can be answered from
+    # the stored result
+    """
+    ALTER TABLE submissions ADD COLUMN upload_hash TEXT;
+    CREATE INDEX idx_submissions_upload_hash ON submissions (upload_hash);
+    """,
+    # Search results per canonical position and side to move (see
+    # analysis_cache_utils); best_move is a square index in the canonical
+    # orientation
+    """
+    CREATE TABLE positions (
+        position TEXT,
+        player INTEGER,
+        best_move INTEGER,
+        score REAL,
+        depth INTEGER,
+        exact INTEGER,
+        time_budget REAL,
+        PRIMARY KEY (position, player)
+    );
+    """,
+    # Asynchronous /jobs requests (see job_utils). The upload is kept in the
+    # blob store under upload_hash so an interrupted job can be run again;
+    # board, white and black hold JSON progress and version is bumped on
+    # every change so pollers can tell when to look again
+    """
+    CREATE TABLE jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT,
+        created REAL,
+        updated REAL,
+        version INTEGER,
+        original_filename TEXT,
+        upload_hash TEXT,
+        time_budget REAL,
+        board TEXT,
+        white TEXT,
+        black TEXT,
+        result TEXT,
+        error TEXT
+    );
+    CREATE INDEX idx_jobs_status ON jobs (status, updated);
+    """,
+    # Best move squares and image coordinates as JSON, so a result can be
+    # served without an annotated image
+    """
+    ALTER TABLE submissions ADD COLUMN moves TEXT;
+    """,
+    # Keyset pagination of the history walks (timestamp, id); filenames are
+    # filtered by prefix. The small preview of the upload is a blob too
+    """
+    DROP INDEX IF EXISTS idx_submissions_timestamp;
+    CREATE INDEX idx_submissions_timestamp_id ON submissions (timestamp, id);
+    CREATE INDEX idx_submissions_filename ON submissions (original_filename);
+    ALTER TABLE submissions ADD COLUMN thumbnail_hash TEXT;
+    """,
+    # One submission per original image, enforced by the database so
+    # concurrent identical uploads cannot both be stored; duplicates that
+    # got in before are dropped, keeping the first one
+    """
+    DELETE FROM submissions WHERE original_image_hash IS NOT NULL AND rowid NOT IN (
+        SELECT MIN(rowid) FROM submissions WHERE original_image_hash IS NOT NULL
+        GROUP BY original_image_hash
+    );
+    DROP INDEX idx_submissions_original_hash;
+    CREATE UNIQUE INDEX idx_submissions_original_hash ON submissions (original_image_hash);
+    """,
+]
+
+# Page size of the history listing when none is asked for, and the largest
+# page a client may ask for
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+# Leading bytes of the image formats uploads and results come in
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"BM", "image/bmp"),
+]
+
+_local = threading.local()
+
+
+def get_connection(path=DB_PATH):
+    """
+    Returns this thread's connection to `path`, opening it on first use. A
+    forked worker process opens its own connections rather than reusing the
+    parent's.
+    """
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        _local.pid = pid
+        _local.connections = {}
+    conn = _local.connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        _local.connections[path] = conn
+    return conn
+
+
+def close_connections():
+    """Closes the calling thread's connections."""
+    for conn in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = {}
+
+
+def init_db(path=DB_PATH):
+    """
+    Switches the database to WAL mode and applies any pending migrations.
+    Safe to call from several workers at once: the version is re-checked
+    inside a write transaction, so each migration runs exactly once.
+    """
+    conn = get_connection(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for migration in MIGRATIONS[version:]:
+            for statement in migration.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def sniff_image_type(data):
+    """Returns the MIME type of encoded image bytes, judged by their first bytes."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, image_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return image_type
+    return "application/octet-stream"
+
+
+def blob_path(digest, blob_dir=BLOB_DIR):
+    return os.path.join(blob_dir, digest[:2], digest)
+
+
+def put_blob(data, blob_dir=BLOB_DIR):
+    """
+    Stores `data` under its SHA-256 hex digest and returns the digest.
+    Content that is already stored is not written again.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest, blob_dir)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+    return digest
+
+
+def get_blob(digest, blob_dir=BLOB_DIR):
+    """Returns the bytes stored under `digest`, or None if there are none."""
+    try:
+        with open(blob_path(digest, blob_dir), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def save_submission(submission_id, original_filename, original_image, result_image,
+                    white_score, black_score, lead_message, image_type="image/png",
+                    upload_hash=None, path=DB_PATH, blob_dir=BLOB_DIR, original_type=None,
+                    moves=None, thumbnail=None):
+    """
+    Stores a submission whose original and annotated images are given as
+    encoded image bytes, the annotated one of `image_type` and the original
+    one of `original_type` (the same by default). The annotated image may be
+    None when only the `moves` (a JSON-serialisable dict) are kept.
+    `upload_hash` is the hash of the bytes that were uploaded, used to
+    answer repeated uploads, and `thumbnail` optional encoded preview
+    bytes for the history listing. Returns False without writing if a submission
+    of the same original image already exists.
+    """
+    original_hash = hashlib.sha256(original_image).hexdigest()
+    conn = get_connection(path)
+    # Skips writing the blobs of a known duplicate; the unique index on
+    # original_image_hash settles uploads that race past this check
+    if conn.execute("SELECT 1 FROM submissions WHERE original_image_hash = ?",
+                    (original_hash,)).fetchone():
+        return False
+
+    put_blob(original_image, blob_dir)
+    result_hash = put_blob(result_image, blob_dir) if result_image is not None else None
+    thumbnail_hash = put_blob(thumbnail, blob_dir) if thumbnail is not None else None
+    with conn:
+        cursor = conn.execute("""
+            INSERT INTO submissions (
+                id, timestamp, original_filename, original_image_hash, original_image_type,
+                result_image_hash, result_image_type, white_score, black_score, lead_message,
+                upload_hash, moves, thumbnail_hash
+            )
+            VALUES (?, datetime('now'), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (original_image_hash) DO NOTHING
+        """, (submission_id, original_filename, original_hash, original_type or image_type,
+              result_hash, image_type if result_hash else None, white_score, black_score,
+              lead_message, upload_hash, json.dumps(moves) if moves is not None else None,
+              thumbnail_hash))
+    return cursor.rowcount == 1
+
+
+def get_submission(submission_id, path=DB_PATH, blob_dir=BLOB_DIR):
+    """
+    Returns the stored submission as a dict with both images base64 encoded
+    (the annotated one None if only the moves were kept) and their types,
+    or None if there is none.
+    """
+    row = get_connection(path).execute("""
+        SELECT original_filename, original_image_hash, result_image_hash,
+               original_image_base64, result_image_base64,
+               white_score, black_score, lead_message,
+               original_image_type, result_image_type, moves
+        FROM submissions WHERE id = ?
+    """, (submission_id,)).fetchone()
+    if row is None:
+        return None
+
+    def image(digest, legacy_base64):
+        if digest is None:
+            return legacy_base64
+        data = get_blob(digest, blob_dir)
+        return base64.b64encode(data).decode("utf-8") if data is not None else None
+
+    return {
+        "filename": row[0],
+        "original_image": image(row[1], row[3]),
+        "image": image(row[2], row[4]),
+        "white_score": row[5],
+        "black_score": row[6],
+        "lead": row[7],
+        "original_image_type": row[8] or "image/png",
+        "image_type": row[9] or ("image/png" if row[2] or row[4] else None),
+        "moves": json.loads(row[10]) if row[10] else None
+    }
+
+
+def migrate_legacy_images(path=DB_PATH, blob_dir=BLOB_DIR, batch_size=100):
+    """
+    Moves base64 images of rows written before the blob store into it and
+    clears their base64 columns. Safe to interrupt and run again. Returns
+    the number of rows moved.
+    """
+    conn = get_connection(path)
+    moved = 0
+    while True:
+        rows = conn.execute("""
+            SELECT id, original_image_base64, result_image_base64 FROM submissions
+            WHERE original_image_base64 IS NOT NULL OR result_image_base64 IS NOT NULL
+            LIMIT ?
+        """, (batch_size,)).fetchall()
+        if not rows:
+            return moved
+
+        updates = []
+        for submission_id, original_base64, result_base64 in rows:
+            original_hash = put_blob(base64.b64decode(original_base64), blob_dir) if original_base64 else None
+            result_hash = put_blob(base64.b64decode(result_base64), blob_dir) if result_base64 else None
+            updates.append((original_hash, result_hash, submission_id))
+        with conn:
+            conn.executemany("""
+                UPDATE OR IGNORE submissions SET
+                    original_image_hash = ?, original_image_type = 'image/png',
+                    result_image_hash = ?, result_image_type = 'image/png',
+                    original_image_base64 = NULL, result_image_base64 = NULL
+                WHERE id = ?
+            """, updates)
+            # A row whose original image another submission already has is
+            # left unchanged by the update above; like a repeated upload, it
+            # is not kept
+            conn.executemany("DELETE FROM submissions WHERE id = ? AND original_image_base64 IS NOT NULL",
+                             [(submission_id,) for _, _, submission_id in updates])
+        moved += len(rows)
+
+
+def get_result_by_upload_hash(digest, path=DB_PATH, blob_dir=BLOB_DIR):
+    """
+    Returns the stored result for the upload with hash `digest` as a dict
+    with the annotated image bytes and type (None if only the moves were
+    kept), white_score, black_score, lead and moves, or None if that upload
+    was never stored.
+    """
+    row = get_connection(path).execute("""
+        SELECT result_image_hash, result_image_base64, white_score, black_score, lead_message,
+               result_image_type, moves
+        FROM submissions WHERE upload_hash = ? LIMIT 1
+    """, (digest,)).fetchone()
+    if row is None:
+        return None
+    image, image_type = None, row[5]
+    if row[0] is not None:
+        image = get_blob(row[0], blob_dir)
+        if image is None:
+            return None
+    elif row[1] is not None:
+        image, image_type = base64.b64decode(row[1]), "image/png"
+    return {"image": image, "image_type": image_type, "white_score": row[2], "black_score": row[3],
+            "lead": row[4], "moves": json.loads(row[6]) if row[6] else None}
+
+
+def get_position_analysis(position, player, path=DB_PATH):
+    """Returns the stored analysis of `position` with `player` to move, or None."""
+    row = get_connection(path).execute("""
+        SELECT best_move, score, depth, exact, time_budget FROM positions
+        WHERE position = ? AND player = ?
+    """, (position, player)).fetchone()
+    if row is None:
+        return None
+    return {"best_move": row[0], "score": row[1], "depth": row[2],
+            "exact": bool(row[3]), "time_budget": row[4]}
+
+
+def save_position_analysis(position, player, entry, path=DB_PATH):
+    """
+    Stores the analysis of `position` with `player` to move, keeping the
+    existing one if it is exact or deeper.
+    """
+    conn = get_connection(path)
+    with conn:
+        conn.execute("""
+            INSERT INTO positions (position, player, best_move, score, depth, exact, time_budget)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (position, player) DO UPDATE SET
+                best_move = excluded.best_move, score = excluded.score, depth = excluded.depth,
+                exact = excluded.exact, time_budget = excluded.time_budget
+            WHERE NOT positions.exact AND positions.depth <= excluded.depth
+        """, (position, player, entry["best_move"], entry["score"], entry["depth"],
+              int(entry["exact"]), entry["time_budget"]))
+
+
+# Job columns update_job may set
+JOB_FIELDS = ("status", "board", "white", "black", "result", "error")
+
+
+def create_job(job_id, original_filename, upload_hash, time_budget, path=DB_PATH):
+    """Records a queued job for the upload stored under `upload_hash`."""
+    now = time.time()
+    conn = get_connection(path)
+    with conn:
+        conn.execute("""
+            INSERT INTO jobs (id, status, created, updated, version, original_filename,
+                              upload_hash, time_budget)
+            VALUES (?, 'queued', ?, ?, 1, ?, ?, ?)
+        """, (job_id, now, now, original_filename, upload_hash, time_budget))
+
+
+def claim_job(job_id, path=DB_PATH):
+    """
+    Marks a queued job as running. Returns False if it is not queued, e.g.
+    because another worker claimed it first.
+    """
+    conn = get_connection(path)
+    with conn:
+        cursor = conn.execute("""
+            UPDATE jobs SET status = 'running', updated = ?, version = version + 1
+            WHERE id = ? AND status = 'queued'
+        """, (time.time(), job_id))
+    return cursor.rowcount == 1
+
+
+def update_job(job_id, path=DB_PATH, **fields):
+    """Sets the given JOB_FIELDS of a job and bumps its version."""
+    for name in fields:
+        if name not in JOB_FIELDS:
+            raise ValueError(f"unknown job field {name!r}")
+    assignments = "".join(f"{name} = ?, " for name in fields)
+    conn = get_connection(path)
+    with conn:
+        conn.execute(f"UPDATE jobs SET {assignments}updated = ?, version = version + 1 WHERE id = ?",
+                     (*fields.values(), time.time(), job_id))
+
+
+def get_job(job_id, path=DB_PATH):
+    """Returns the job as a dict (JSON columns still encoded), or None."""
+    row = get_connection(path).execute("""
+        SELECT id, status, created, updated, version, original_filename, upload_hash,
+               time_budget, board, white, black, result, error
+        FROM jobs WHERE id = ?
+    """, (job_id,)).fetchone()
+    if row is None:
+        return None
+    keys = ("id", "status", "created", "updated", "version", "filename", "upload_hash",
+            "time_budget", "board", "white", "black", "result", "error")
+    return dict(zip(keys, row))
+
+
+def requeue_stale_jobs(stale_after, path=DB_PATH):
+    """
+    Puts running jobs that have not been updated for `stale_after` seconds
+    (their worker died) back in the queue and returns the ids of every
+    queued job, oldest first.
+    """
+    conn = get_connection(path)
+    with conn:
+        conn.execute("""
+            UPDATE jobs SET status = 'queued', board = NULL, white = NULL, black = NULL,
+                            updated = ?, version = version + 1
+            WHERE status = 'running' AND updated < ?
+        """, (time.time(), time.time() - stale_after))
+    rows = conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created").fetchall()
+    return [row[0] for row in rows]
+
+
+def encode_cursor(item):
+    """Opaque history cursor pointing just after the listed submission `item`."""
+    key = json.dumps([item["timestamp"], item["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(key).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) of an encode_cursor value; raises ValueError if it is not one."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError(f"invalid cursor {cursor!r}")
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(v, str) for v in key)):
+        raise ValueError(f"invalid cursor {cursor!r}")
+    return key
+
+
+def list_submissions(path=DB_PATH, limit=None, cursor=None, filename=None, since=None, until=None):
+    """
+    Yields the submissions newest first as dicts with id, filename,
+    timestamp, scores, lead and thumbnail_hash, never reading the image
+    columns. Rows are read lazily, so callers can stream them.
+
+    Keyset pagination: at most `limit` rows (None for all), starting after
+    the row `cursor` (from encode_cursor) points at. `filename` keeps names
+    starting with it; `since` and `until` ("YYYY-MM-DD HH:MM:SS" UTC, as
+    stored) keep rows at or after, and before, those times.
+    """
+    conditions, params = [], []
+    if cursor is not None:
+        conditions.append("(timestamp, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    if filename:
+        # A range instead of LIKE, so the filename index is used
+        conditions.append("original_filename >= ? AND original_filename < ?")
+        params.extend([filename, filename[:-1] + chr(ord(filename[-1]) + 1)])
+    if since is not None:
+        conditions.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("timestamp < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit_clause = "LIMIT ?" if limit is not None else ""
+    if limit is not None:
+        params.append(limit)
+
+    rows = get_connection(path).execute(f"""
+        SELECT id, original_filename, timestamp, white_score, black_score, lead_message, thumbnail_hash
+        FROM submissions {where}
+        ORDER BY timestamp DESC, id DESC {limit_clause}
+    """, params)
+    for row in rows:
+        yield {"id": row[0], "filename": row[1], "timestamp": row[2], "white_score": row[3],
+               "black_score": row[4], "lead": row[5], "thumbnail_hash": row[6]}
@@ -0,0 +1,267 @@
+import logging
+import threading
+import time
+import uuid
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils import metrics_utils, piece_detection_utils
+from utils.metrics_utils import span
+from utils.pipeline_utils import SIDES, game_status, locate_board
+
+logger = logging.getLogger(__name__)
+
+# Live mode: follows one physical board through consecutive camera frames.
+# Corners are found with the full Hough detection once; after that they are
+# carried from frame to frame by tracking feature points inside the board with
+# optical flow and fitting a homography to them. Hough runs again only when
+# too few points could be tracked, the fit is poor, or the corners have
+# drifted too far from where Hough last put them. Each frame the board is
+# warped once; only cells whose average color changed are classified again,
+# and the best moves are searched again only when the board itself changed.
+
+# Longer side of the grayscale copy of each frame points are tracked on
+TRACK_MAX_SIDE = 480
+
+# Tracking is trusted with at least this many points, of which at least this
+# share agree with the fitted homography
+MIN_TRACKED_POINTS = 12
+MIN_INLIER_RATIO = 0.6
+
+# Hough re-anchors the corners once they have moved this share of the board's
+# size since it last ran
+DRIFT_FRACTION = 0.1
+
+# A cell is classified again when any channel of its average color (0-1)
+# moved by more than this
+CELL_CHANGE_THRESHOLD = 0.08
+
+# A new board must be read in this many consecutive frames before it replaces
+# the current one, so a hand passing over the board does not trigger searches
+STABLE_FRAMES = 2
+
+
+def decode_frame(data):
+    """An encoded image as an RGB uint8 array; raises OSError if it is not one."""
+    return np.array(Image.open(BytesIO(data)).convert("RGB"))
+
+
+def align_corners(corners, previous):
+    """
+    Hough lists the corners in no fixed order. Returns `corners` reordered,
+    keeping their cyclic order, to match `previous` as closely as possible
+    so rows and columns keep their meaning.
+    """
+    candidates = [np.roll(order, shift, axis=0) for order in (corners, corners[::-1]) for shift in range(4)]
+    return min(candidates, key=lambda candidate: float(np.sum((candidate - previous) ** 2)))
+
+
+class BoardTracker:
+    """
+    Tracks a board across the frames of one stream and keeps its analysis
+    current. Frames go to update() in order; each returns the board, scores,
+    lead message and best moves (with their image coordinates in that frame)
+    plus how the frame was handled. Searches use `pipeline`'s worker pool and
+    analysis cache with `time_budget` seconds per changed board.
+    """
+
+    def __init__(self, pipeline, time_budget):
+        self.pipeline = pipeline
+        self.time_budget = time_budget
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+        self.frames = 0
+        self.hough_runs = 0
+        self.searches = 0
+        self.corners = None  # (4, 2) float32 corners in frame pixels
+        self.anchor = None  # corners where Hough last found them
+        self.gray = None  # previous frame, downscaled and grayscale
+        self.scale = 1.0  # gray pixels per frame pixel
+        self.colors = None  # average color of each cell in the last frame
+        self.cells = None  # classified cells of the last frame
+        self.board_state = None  # accepted board
+        self.pending = None  # (board, frames seen) of a board not yet accepted
+        self.analysis = None  # scores, lead and best moves of the accepted board
+
+    def update(self, frame):
+        """Processes the next frame (RGB uint8) and returns the frame's result dict."""
+        with self.lock:
+            self.last_used = time.monotonic()
+            self.frames += 1
+            with metrics_utils.trace() as spans:
+                result = self._update(frame)
+            metrics_utils.record_spans(spans)
+            result["frame"] = self.frames
+            return result
+
+    def _update(self, frame):
+        with span("stream_track"):
+            gray, scale = self._gray(frame)
+            tracking = self._track(gray, scale) if self.corners is not None else None
+        self.gray, self.scale = gray, scale
+
+        if tracking is None:
+            located = self.pipeline.run_traced(locate_board, frame, self.pipeline.config)
+            self.hough_runs += 1
+            if "error" in located:
+                self.corners = self.colors = None
+                return {"error": located["error"], "tracking": "hough"}
+            corners = np.float32(located["corners"])
+            if self.corners is not None:
+                corners = align_corners(corners, self.corners)
+            self.corners = self.anchor = corners
+            self.colors = None
+            tracking = {"method": "hough"}
+
+        with span("stream_cells") as attributes:
+            H, colors = piece_detection_utils.board_cell_colors(np.float32(frame) / 255.0, self.corners)
+            if self.colors is None:
+                changed = np.ones((8, 8), dtype=bool)
+            else:
+                changed = np.max(np.abs(colors - self.colors), axis=-1) > CELL_CHANGE_THRESHOLD
+            cells = self.cells.copy() if self.cells is not None and self.colors is not None else np.zeros((8, 8))
+            cells[changed] = piece_detection_utils.classify_colors_rgb(colors[changed][..., ::-1])
+            self.colors, self.cells = colors, cells
+            attributes["changed"] = int(np.sum(changed))
+
+        new_board = self._stable_board(cells)
+        board_changed = new_board is not None
+        if board_changed:
+            # Searched before it is accepted, so a failed search is retried next frame
+            self.analysis = self._analyse(new_board)
+            self.board_state = new_board
+            self.searches += 1
+
+        dict_board = piece_detection_utils.cell_centers(H)
+        moves = {"white": None, "black": None}
+        for side, move in self.analysis["best_moves"].items():
+            if move is not None:
+                y, x = dict_board[move]
+                moves[side] = {"square": list(move), "y": float(y), "x": float(x)}
+
+        return {
+            "board_state": self.board_state.astype(int).tolist(),
+            "board_changed": board_changed,
+            "pending_change": self.pending is not None,
+            "white_score": self.analysis["white_score"],
+            "black_score": self.analysis["black_score"],
+            "lead": self.analysis["lead"],
+            "moves": moves,
+            "corners": self.corners.tolist(),
+            "tracking": tracking["method"],
+            "tracking_confidence": tracking.get("confidence"),
+            "changed_cells": int(np.sum(changed)),
+        }
+
+    def _gray(self, frame):
+        scale = min(1.0, TRACK_MAX_SIDE / max(frame.shape[:2]))
+        small = frame if scale == 1.0 else cv2.resize(
+            frame, (round(frame.shape[1] * scale), round(frame.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY), scale
+
+    def _track(self, gray, scale):
+        """
+        Moves the corners from the previous frame to this one. Returns a dict
+        with the method and confidence, or None if Hough has to run again.
+        """
+        if self.gray is None or gray.shape != self.gray.shape:
+            return None
+
+        # Feature points inside the board in the previous frame
+        mask = np.zeros_like(self.gray)
+        cv2.fillConvexPoly(mask, np.int32(self.corners * self.scale), 255)
+        points = cv2.goodFeaturesToTrack(self.gray, maxCorners=200, qualityLevel=0.01, minDistance=5, mask=mask)
+        if points is None or len(points) < MIN_TRACKED_POINTS:
+            return None
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self.gray, gray, points, None)
+        found = status.reshape(-1) == 1
+        if np.sum(found) < MIN_TRACKED_POINTS:
+            return None
+        H, inliers = cv2.findHomography(points[found], moved[found], cv2.RANSAC, 3.0)
+        if H is None:
+            return None
+        confidence = float(np.sum(inliers)) / len(points)
+        if confidence < MIN_INLIER_RATIO:
+            return None
+
+        corners = cv2.perspectiveTransform((self.corners * self.scale).reshape(-1, 1, 2), H).reshape(4, 2) / scale
+        size = np.linalg.norm(self.anchor[0] - self.anchor[2])
+        if np.max(np.linalg.norm(corners - self.anchor, axis=1)) > DRIFT_FRACTION * size:
+            return None
+        self.corners = np.float32(corners)
+        return {"method": "flow", "confidence": round(confidence, 3)}
+
+    def _stable_board(self, cells):
+        """The board to accept after reading `cells`, or None to keep the current one (see STABLE_FRAMES)."""
+        if self.board_state is None:
+            self.pending = None
+            return cells.copy()
+        if np.array_equal(cells, self.board_state):
+            self.pending = None
+            return None
+        if self.pending is not None and np.array_equal(cells, self.pending[0]):
+            self.pending = (self.pending[0], self.pending[1] + 1)
+        else:
+            self.pending = (cells.copy(), 1)
+        if self.pending[1] < STABLE_FRAMES:
+            return None
+        board, self.pending = self.pending[0], None
+        return board
+
+    def _analyse(self, board_state):
+        white_score, black_score, players, lead_message = game_status(board_state)
+        best_moves = {"white": None, "black": None}
+        if players:
+            results = self.pipeline.analyse_positions(board_state, players, self.time_budget)
+            for player, result in results.items():
+                metrics_utils.record_search(SIDES[player], result)
+                best_moves[SIDES[player]] = result["best_move"]
+        return {"white_score": int(white_score), "black_score": int(black_score),
+                "lead": lead_message, "best_moves": best_moves}
+
+    def stats(self):
+        return {"frames": self.frames, "hough_runs": self.hough_runs, "searches": self.searches}
+
+
+class TrackerSessions:
+    """
+    The open streams of a server process, each a BoardTracker under an id.
+    Streams without a frame for `idle_timeout` seconds are closed.
+    """
+
+    def __init__(self, pipeline, idle_timeout=300.0):
+        self.pipeline = pipeline
+        self.idle_timeout = idle_timeout
+        self.trackers = {}
+        self.lock = threading.Lock()
+
+    def open(self, time_budget=None):
+        """Starts a stream and returns its id."""
+        self._expire()
+        stream_id = str(uuid.uuid4())
+        with self.lock:
+            self.trackers[stream_id] = BoardTracker(self.pipeline, self.pipeline.time_budget(time_budget))
+        return stream_id
+
+    def get(self, stream_id):
+        """The stream's BoardTracker, or None if there is none."""
+        self._expire()
+        with self.lock:
+            return self.trackers.get(stream_id)
+
+    def close(self, stream_id):
+        """Closes the stream and returns its tracker's stats, or None if there was none."""
+        with self.lock:
+            tracker = self.trackers.pop(stream_id, None)
+        return tracker.stats() if tracker is not None else None
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        with self.lock:
+            for stream_id in [i for i, tracker in self.trackers.items() if tracker.last_used < cutoff]:
+                del self.trackers[stream_id]
@@ -0,0 +1,108 @@
+import random
+from utils import bitboard_utils as bb
+
+# Zobrist hashing: every (square, colour) pair gets a random 64-bit key and a
+# position's hash is the XOR of the keys of its discs, so a move can update
+# the hash by XOR-ing only the placed and flipped squares. The keys are
+# generated from a fixed seed so hashes are stable across processes.
+ZOBRIST_SEED = 20250717
+_rng = random.Random(ZOBRIST_SEED)
+WHITE_KEYS = [_rng.getrandbits(64) for _ in range(64)]
+BLACK_KEYS = [_rng.getrandbits(64) for _ in range(64)]
+FLIP_KEYS = [w ^ b for w, b in zip(WHITE_KEYS, BLACK_KEYS)]
+WHITE_TO_MOVE_KEY = _rng.getrandbits(64)
+
+# Bound types stored with each entry
+EXACT = 0
+LOWER = 1  # score is a lower bound (search failed high)
+UPPER = 2  # score is an upper bound (search failed low)
+
+
+def zobrist_hash(white, black, player):
+    """Hashes a position from scratch. `player` is the side to move."""
+    h = WHITE_TO_MOVE_KEY if player == 1 else 0
+    for sq in bb.iter_squares(white):
+        h ^= WHITE_KEYS[sq]
+    for sq in bb.iter_squares(black):
+        h ^= BLACK_KEYS[sq]
+    return h
+
+
+def update_hash(h, player, sq, flips):
+    """
+    Returns the hash after `player` plays `sq` flipping `flips`, with the
+    side to move handed to the opponent.
+    """
+    h ^= (WHITE_KEYS if player == 1 else BLACK_KEYS)[sq]
+    for flipped in bb.iter_squares(flips):
+        h ^= FLIP_KEYS[flipped]
+    return h ^ WHITE_TO_MOVE_KEY
+
+
+def pass_hash(h):
+    """Returns the hash after the side to move passes."""
+    return h ^ WHITE_TO_MOVE_KEY
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results.
+
+    The table is a preallocated list of 2**n slots indexed by the low bits of
+    the Zobrist hash, so memory stays flat however long the worker runs. When
+    two positions collide the deeper result is kept, except that results
+    left over from an older search (see new_search) are always replaced.
+
+    Each entry is a tuple (key, depth, flag, score, move, extra, generation).
+    `extra` is opaque data the caller wants back alongside the score.
+    """
+
+    def __init__(self, size=1 << 18):
+        # Round down to a power of two so the index is a simple mask
+        size = 1 << max(0, int(size).bit_length() - 1)
+        self.size = size
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def new_search(self):
+        """Marks existing entries as stale so they are the first to be replaced."""
+        self.generation += 1
+
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, flag, score, move, extra=None):
+        index = key & self.mask
+        current = self.entries[index]
+        if (current is None or current[0] == key or current[6] != self.generation
+                or depth >= current[1]):
+            self.entries[index] = (key, depth, flag, score, move, extra, self.generation)
+            self.stores += 1
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / probes, 4) if probes else 0.0,
+            "stores": self.stores,
+        }
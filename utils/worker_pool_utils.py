@@ -0,0 +1,144 @@
+import atexit
+import importlib
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+
+class WorkerError(Exception):
+    """Base class of the errors raised by WorkerPool.result."""
+
+
+class JobTimeout(WorkerError):
+    """The job did not finish within the pool's timeout."""
+
+
+class WorkerCrashed(WorkerError):
+    """The worker process running the job died; the pool has been restarted."""
+
+
+def _init_worker(preload, initializer, initargs):
+    # Ctrl-C goes to the whole process group; let the parent shut the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for module in preload:
+        importlib.import_module(module)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _ready():
+    return True
+
+
+class WorkerPool:
+    """
+    Pool of worker processes for CPU-bound jobs, so they run outside the
+    request thread and on more than one core.
+
+    Workers are forked from a server process that has already imported
+    `preload` (forkserver, where the platform has it), then each runs
+    `initializer(*initargs)` once, and all of them are started up front so
+    the first request does not pay for it. With workers=0 jobs run inline
+    in the calling thread, which is useful for debugging and single-core
+    machines.
+
+    `timeout` bounds how long result() waits for a job. A job that times out
+    before it starts is cancelled; one that is already running keeps its
+    worker until it returns. If a worker dies, the pool is restarted and the
+    jobs that were on it fail with WorkerCrashed.
+    """
+
+    def __init__(self, workers, timeout=None, preload=(), initializer=None, initargs=()):
+        self.workers = workers
+        self.timeout = timeout
+        self.preload = list(preload)
+        self.initializer = initializer
+        self.initargs = initargs
+        self.lock = threading.Lock()
+        self.executor = None
+        self.completed = 0
+        self.timeouts = 0
+        self.crashes = 0
+        if workers > 0:
+            self._start()
+            atexit.register(self.shutdown)
+
+    def _start(self):
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(self.preload)
+        else:
+            context = multiprocessing.get_context("spawn")
+        self.executor = ProcessPoolExecutor(
+            self.workers, mp_context=context, initializer=_init_worker,
+            initargs=(self.preload, self.initializer, self.initargs)
+        )
+        # Start every worker now rather than on first use
+        for future in [self.executor.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, fn, *args):
+        """Schedules fn(*args) on a worker and returns its Future."""
+        if self.workers == 0:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        with self.lock:
+            if self.executor is None:
+                raise RuntimeError("worker pool is shut down")
+            return self.executor.submit(fn, *args)
+
+    def result(self, future):
+        """Waits for a submitted job and returns its result, re-raising its exception."""
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self.lock:
+                self.timeouts += 1
+            raise JobTimeout(f"job did not finish within {self.timeout}s")
+        except BrokenProcessPool:
+            self._restart()
+            raise WorkerCrashed("a worker process died while running the job")
+        with self.lock:
+            self.completed += 1
+        return result
+
+    def run(self, fn, *args):
+        """Runs fn(*args) on a worker and returns its result."""
+        return self.result(self.submit(fn, *args))
+
+    def _restart(self):
+        with self.lock:
+            if self.executor is None:
+                return
+            try:
+                self.executor.submit(_ready)
+                return  # already restarted by another thread
+            except BrokenProcessPool:
+                pass
+            self.crashes += 1
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self._start()
+
+    def shutdown(self, wait=True):
+        """Cancels queued jobs and stops the workers once running jobs finish."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "completed": self.completed,
+                "timeouts": self.timeouts,
+                "crashes": self.crashes,
+            }